@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from config import SEND_SAMPLE_RATE, AUDIO_FRAME_MS, AUDIO_MAX_QUEUE_MS, AUDIO_OVERFLOW_POLICY
+
+logger = logging.getLogger(__name__)
+
+# What to do when the client sends audio faster than Gemini accepts it
+POLICY_DROP_OLDEST = "drop_oldest"  # keep the freshest audio, discard stale audio
+POLICY_DROP_NEWEST = "drop_newest"  # keep what is queued, discard incoming audio
+POLICY_BLOCK = "block"              # stop reading from the client until there is room
+
+class AudioPipeline:
+    """
+    Bounded client -> Gemini PCM buffer for one session.
+    Small chunks from the client are coalesced into frames of about `frame_ms`;
+    a partial frame is sent once its oldest chunk has waited `frame_ms`, so
+    trailing speech is never held back. Queue depth is capped at `max_queue_ms`.
+    """
+
+    def __init__(self, sample_rate=SEND_SAMPLE_RATE, frame_ms=AUDIO_FRAME_MS,
+                 max_queue_ms=AUDIO_MAX_QUEUE_MS, policy=AUDIO_OVERFLOW_POLICY):
+        self.bytes_per_ms = sample_rate * 2 / 1000  # 16-bit mono PCM
+        self.frame_bytes = int(frame_ms * self.bytes_per_ms)
+        self.max_bytes = int(max_queue_ms * self.bytes_per_ms)
+        self.flush_after = frame_ms / 1000
+        self.policy = policy
+        self._chunks = deque()  # (chunk, received_at)
+        self._size = 0
+        self._data_ready = asyncio.Event()
+        self._space_ready = asyncio.Event()
+
+        self.chunks_in = 0
+        self.frames_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.dropped_bytes = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def _append(self, chunk: bytes):
+        self._chunks.append((chunk, time.monotonic()))
+        self._size += len(chunk)
+        self.chunks_in += 1
+        self.bytes_in += len(chunk)
+        self._data_ready.set()
+
+    async def put(self, chunk: bytes):
+        """Queue a chunk from the client, applying the overflow policy when full."""
+        if not chunk:
+            return
+        if self._size + len(chunk) > self.max_bytes:
+            if self.policy == POLICY_BLOCK:
+                while self._size and self._size + len(chunk) > self.max_bytes:
+                    self._space_ready.clear()
+                    await self._space_ready.wait()
+            elif self.policy == POLICY_DROP_NEWEST:
+                self.dropped_bytes += len(chunk)
+                return
+            else:
+                while self._chunks and self._size + len(chunk) > self.max_bytes:
+                    old, _ = self._chunks.popleft()
+                    self._size -= len(old)
+                    self.dropped_bytes += len(old)
+        self._append(chunk)
+
+    async def get_frame(self):
+        """
+        Wait for the next coalesced frame. Returns (frame, received_at) where
+        received_at is when the frame's oldest chunk arrived from the client.
+        """
+        while True:
+            if self._size >= self.frame_bytes:
+                break
+            if self._chunks:
+                remaining = self.flush_after - (time.monotonic() - self._chunks[0][1])
+                if remaining <= 0:
+                    break
+                self._data_ready.clear()
+                try:
+                    await asyncio.wait_for(self._data_ready.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                self._data_ready.clear()
+                await self._data_ready.wait()
+
+        received_at = self._chunks[0][1]
+        parts = []
+        taken = 0
+        while self._chunks and taken < self.frame_bytes:
+            chunk, _ = self._chunks.popleft()
+            parts.append(chunk)
+            taken += len(chunk)
+        self._size -= taken
+        self._space_ready.set()
+        frame = parts[0] if len(parts) == 1 else b"".join(parts)
+        self.frames_out += 1
+        self.bytes_out += len(frame)
+        return frame, received_at
+
+    def record_sent(self, received_at: float):
+        """Record end-to-end lag once a frame has been handed to Gemini."""
+        self.last_lag_ms = (time.monotonic() - received_at) * 1000
+        self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+
+    @property
+    def depth_ms(self) -> float:
+        return self._size / self.bytes_per_ms
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth_ms": round(self.depth_ms, 1),
+            "queue_depth_bytes": self._size,
+            "chunks_in": self.chunks_in,
+            "frames_out": self.frames_out,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "dropped_bytes": self.dropped_bytes,
+            "last_lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+        }
@@ -0,0 +1,180 @@
+"""
+Compare embedding backends (EMBEDDING_BACKEND) and models on CPU: load time,
+memory, query latency, batch throughput, retrieval quality, and how closely
+each backend reproduces the fp32 vectors the index was built with.
+
+Each candidate is "<backend>" or "<backend>:<model name>" and is measured in a
+fresh process, so memory numbers don't include the other candidates. The first
+candidate is the reference:
+
+    python benchmark_embeddings.py
+    python benchmark_embeddings.py --candidates torch,onnx-int8,torch:sentence-transformers/all-MiniLM-L6-v2
+
+Quality is measured on the labeled queries in retrieval_queries.jsonl against
+an in-memory corpus of document titles from medical_docs_meta.jsonl. A candidate
+using the reference model must keep every vector within --min-cosine of the
+reference vector; otherwise the script exits 1. A different model produces
+vectors the existing index can't be queried with (re-run upload_to_pinecone.py),
+so it only gets the quality and speed comparison.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+sys.path.insert(0, os.path.dirname(__file__))
+
+HERE = os.path.dirname(__file__)
+DEFAULT_QUERIES = os.path.join(HERE, "retrieval_queries.jsonl")
+DEFAULT_CORPUS = os.path.join(HERE, "medical_docs_meta.jsonl")
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def rss_mib() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def load_corpus(path: str, queries, size: int):
+    """Titles of every labeled-relevant document plus the first `size` others, keyed <source>/<document_id>."""
+    relevant = {key for item in queries for key in item["relevant"]}
+    keys, texts = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            doc = json.loads(line)
+            key = f"{doc.get('source', '')}/{doc.get('document_id', '')}"
+            if not doc.get("focus") or (key not in relevant and len(keys) >= size):
+                continue
+            keys.append(key)
+            texts.append(f"Focus: {doc['focus']}")
+    return keys, texts
+
+def _measure(backend: str, model_name: str, queries, corpus, batch_size: int, repeat: int) -> dict:
+    """Runs in a fresh process: configure, load, time and return the vectors."""
+    os.environ["EMBEDDING_BACKEND"] = backend
+    if model_name:
+        os.environ["EMBEDDING_MODEL_NAME"] = model_name
+    before = rss_mib()
+    import embeddings
+
+    start = time.perf_counter()
+    embeddings.get_embedding_model()
+    load_seconds = time.perf_counter() - start
+    embeddings.encode("warm-up")
+    loaded = rss_mib()
+
+    single_ms = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            embeddings.encode(query)
+            single_ms.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    corpus_vectors = embeddings.encode(corpus, batch_size=batch_size)
+    corpus_seconds = time.perf_counter() - start
+    return {
+        "load_seconds": load_seconds,
+        "model_rss_mib": loaded - before,
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "query_p50_ms": percentile(single_ms, 50),
+        "query_p95_ms": percentile(single_ms, 95),
+        "batch_texts_per_second": len(corpus) / corpus_seconds,
+        "query_vectors": np.asarray(embeddings.encode(queries), dtype=np.float32),
+        "corpus_vectors": np.asarray(corpus_vectors, dtype=np.float32),
+    }
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def rank(result: dict, k: int):
+    """Top-k corpus indices per query by cosine similarity."""
+    scores = normalize(result["query_vectors"]) @ normalize(result["corpus_vectors"]).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def retrieval_quality(top, queries, keys) -> dict:
+    hits, reciprocal_ranks = 0, []
+    for item, row in zip(queries, top):
+        relevant = set(item["relevant"])
+        position = next((i + 1 for i, index in enumerate(row) if keys[index] in relevant), None)
+        hits += bool(position)
+        reciprocal_ranks.append(1 / position if position else 0.0)
+    return {"recall_at_k": hits / len(queries), "mrr": float(np.mean(reciprocal_ranks))}
+
+def cosine_to_reference(result: dict, reference: dict) -> np.ndarray:
+    ours = normalize(np.vstack([result["query_vectors"], result["corpus_vectors"]]))
+    theirs = normalize(np.vstack([reference["query_vectors"], reference["corpus_vectors"]]))
+    return np.sum(ours * theirs, axis=1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends against the fp32 reference")
+    parser.add_argument("--candidates", default="torch,torch-int8,onnx,onnx-int8",
+                        help="comma-separated <backend>[:<model>]; the first is the reference")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="labeled query set (JSONL)")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="document metadata (JSONL)")
+    parser.add_argument("--corpus-size", type=int, default=2000, help="documents besides the labeled ones")
+    parser.add_argument("--k", type=int, default=5, help="cutoff for recall@k, MRR and top-k agreement")
+    parser.add_argument("--batch-size", type=int, default=32, help="batch size for the corpus throughput run")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the queries for single-query latency")
+    parser.add_argument("--min-cosine", type=float, default=0.98,
+                        help="lowest allowed cosine to the reference vector for the same model")
+    args = parser.parse_args()
+
+    from config import EMBEDDING_MODEL_NAME
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+    keys, corpus = load_corpus(args.corpus, queries, args.corpus_size)
+    texts = [item["query"] for item in queries]
+    print(f"{len(texts)} queries, {len(corpus)} corpus texts, reference model {EMBEDDING_MODEL_NAME}\n")
+
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for candidate in args.candidates.split(","):
+        backend, _, model_name = candidate.partition(":")
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = pool.submit(_measure, backend, model_name, texts, corpus, args.batch_size, args.repeat).result()
+        except Exception as e:
+            print(f"{candidate}: skipped ({e})")
+            continue
+        result["model"] = model_name or EMBEDDING_MODEL_NAME
+        result["top"] = rank(result, args.k)
+        result.update(retrieval_quality(result["top"], queries, keys))
+        results[candidate] = result
+    if not results:
+        sys.exit("No candidate could be measured")
+
+    reference_name, reference = next(iter(results.items()))
+    failures = []
+    print(f"{'candidate':40s} {'load s':>7s} {'RSS MiB':>8s} {'q p50':>7s} {'q p95':>7s} {'texts/s':>8s} "
+          f"{'recall':>7s} {'MRR':>6s} {'top-k':>6s} {'cos min':>8s} {'cos mean':>8s}")
+    for candidate, result in results.items():
+        agreement = np.mean([
+            len(set(ours) & set(theirs)) / args.k for ours, theirs in zip(result["top"], reference["top"])
+        ])
+        cosine = ""
+        if result["model"] == reference["model"]:
+            similarity = cosine_to_reference(result, reference)
+            cosine = f"{similarity.min():8.4f} {similarity.mean():8.4f}"
+            if similarity.min() < args.min_cosine:
+                failures.append(f"{candidate}: min cosine {similarity.min():.4f} < {args.min_cosine}")
+        print(
+            f"{candidate:40s} {result['load_seconds']:7.1f} {result['model_rss_mib']:8.0f} "
+            f"{result['query_p50_ms']:7.1f} {result['query_p95_ms']:7.1f} {result['batch_texts_per_second']:8.0f} "
+            f"{result['recall_at_k']:7.3f} {result['mrr']:6.3f} {agreement:6.2f} {cosine}"
+        )
+    print(f"\nq p50/p95: single-query encode ms. top-k: overlap with {reference_name}'s top {args.k}. "
+          f"cos: per-vector cosine to {reference_name} (same model only).")
+    if failures:
+        print("\nNot equivalent to the reference vectors:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Retrieval benchmark for rag.py: quality on a labeled query set plus encode/query
+latency and throughput at several batch sizes, compared against a saved baseline.
+
+Each line of the query file is {"query": str, "relevant": ["<source>/<document_id>", ...]};
+a match is relevant when its metadata source/document_id is listed.
+
+    python benchmark_retrieval.py --save-baseline retrieval_baseline.json
+    python benchmark_retrieval.py --baseline retrieval_baseline.json   # exit 1 on regression
+
+The vector store is whichever VECTOR_STORE_BACKEND selects (--backend overrides it).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(__file__), "retrieval_queries.jsonl")
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def load_queries(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def doc_key(match) -> str:
+    metadata = match.get("metadata") or {}
+    return f"{metadata.get('source', '')}/{metadata.get('document_id', '')}"
+
+def evaluate_quality(queries, embeddings, k: int) -> dict:
+    """recall@k: share of queries with a relevant match in the top k. MRR over the top k."""
+    from rag import search_resources
+    hits = 0
+    reciprocal_ranks = []
+    misses = []
+    for item, embedding in zip(queries, embeddings):
+        relevant = set(item["relevant"])
+        ranked = [doc_key(m) for m in search_resources(embedding, k)]
+        rank = next((i + 1 for i, key in enumerate(ranked) if key in relevant), None)
+        if rank:
+            hits += 1
+        else:
+            misses.append(item["query"])
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    return {
+        f"recall_at_{k}": hits / len(queries),
+        "mrr": statistics.fmean(reciprocal_ranks),
+        "misses": misses,
+    }
+
+def measure_latency(texts, batch_sizes, repeat: int, k: int) -> dict:
+    """Encode latency per batch, vector store latency per query and end-to-end queries/s."""
+    from embeddings import encode
+    from rag import search_resources
+    results = {}
+    for batch_size in batch_sizes:
+        encode_ms, query_ms = [], []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for i in range(0, len(texts), batch_size):
+                batch = texts[i:i + batch_size]
+                t0 = time.perf_counter()
+                vectors = encode(batch)
+                encode_ms.append((time.perf_counter() - t0) * 1000)
+                for vector in vectors:
+                    t0 = time.perf_counter()
+                    search_resources(vector.tolist(), k)
+                    query_ms.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - started
+        results[str(batch_size)] = {
+            "encode_p50_ms": percentile(encode_ms, 50),
+            "encode_p95_ms": percentile(encode_ms, 95),
+            "encode_per_query_ms": sum(encode_ms) / (len(texts) * repeat),
+            "query_p50_ms": percentile(query_ms, 50),
+            "query_p95_ms": percentile(query_ms, 95),
+            "queries_per_second": len(texts) * repeat / elapsed,
+        }
+    return results
+
+def find_regressions(report: dict, baseline: dict, max_recall_drop: float, max_latency_increase: float) -> list:
+    problems = []
+    for metric in ("recall_at_k", "mrr"):
+        drop = baseline["quality"][metric] - report["quality"][metric]
+        if drop > max_recall_drop:
+            problems.append(f"{metric} fell from {baseline['quality'][metric]:.3f} to {report['quality'][metric]:.3f}")
+    for batch_size, current in report["latency"].items():
+        previous = baseline["latency"].get(batch_size)
+        if not previous:
+            continue
+        for metric in ("encode_per_query_ms", "query_p50_ms"):
+            limit = previous[metric] * (1 + max_latency_increase)
+            if current[metric] > limit:
+                problems.append(
+                    f"batch {batch_size} {metric} rose from {previous[metric]:.3f} to {current[metric]:.3f} ms "
+                    f"(limit {limit:.3f})"
+                )
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval quality and latency")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="labeled query set (JSONL)")
+    parser.add_argument("--k", type=int, default=5, help="cutoff for recall@k and MRR")
+    parser.add_argument("--batch-sizes", default="1,8,32", help="comma-separated encode batch sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the query set per batch size")
+    parser.add_argument("--backend", choices=["pinecone", "local"], help="override VECTOR_STORE_BACKEND")
+    parser.add_argument("--baseline", help="fail if results regress against this report")
+    parser.add_argument("--save-baseline", help="write this run's report here")
+    parser.add_argument("--max-recall-drop", type=float, default=0.02, help="allowed absolute drop in recall@k/MRR")
+    parser.add_argument("--max-latency-increase", type=float, default=0.25, help="allowed relative latency increase")
+    args = parser.parse_args()
+
+    if args.backend:
+        # Must be set before config is imported
+        os.environ["VECTOR_STORE_BACKEND"] = args.backend
+    from config import VECTOR_STORE_BACKEND
+    from embeddings import encode, warm_up
+
+    queries = load_queries(args.queries)
+    texts = [item["query"] for item in queries]
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    print(f"Benchmarking {len(queries)} queries against the '{VECTOR_STORE_BACKEND}' vector store")
+
+    warm_up()
+    embeddings = [vector.tolist() for vector in encode(texts)]
+    quality = evaluate_quality(queries, embeddings, args.k)
+    latency = measure_latency(texts, batch_sizes, args.repeat, args.k)
+
+    print(f"\nrecall@{args.k}: {quality[f'recall_at_{args.k}']:.3f}   MRR@{args.k}: {quality['mrr']:.3f}")
+    for query in quality["misses"]:
+        print(f"  miss: {query}")
+    print("\nbatch  encode p50/p95 (ms)  encode/query (ms)  query p50/p95 (ms)  queries/s")
+    for batch_size, row in latency.items():
+        print(
+            f"{batch_size:>5}  {row['encode_p50_ms']:8.1f} /{row['encode_p95_ms']:7.1f}  "
+            f"{row['encode_per_query_ms']:17.2f}  {row['query_p50_ms']:8.1f} /{row['query_p95_ms']:7.1f}  "
+            f"{row['queries_per_second']:9.1f}"
+        )
+
+    report = {
+        "backend": VECTOR_STORE_BACKEND,
+        "queries": len(queries),
+        "k": args.k,
+        "quality": {"recall_at_k": quality[f"recall_at_{args.k}"], "mrr": quality["mrr"]},
+        "latency": latency,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("k") != args.k:
+            sys.exit(f"Baseline was recorded with k={baseline.get('k')}, not {args.k}")
+        problems = find_regressions(report, baseline, args.max_recall_drop, args.max_latency_increase)
+        if problems:
+            print("\nRegressions against baseline:")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
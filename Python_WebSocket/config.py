@@ -1,8 +1,6 @@
 import os
-from google import genai
-# Removed direct import of types to use genai.types for consistency
-from google.oauth2 import service_account
-from pinecone import (Pinecone, ServerlessSpec)
+import asyncio
+import threading
 import logging
 from dotenv import load_dotenv
 
@@ -17,6 +15,88 @@ MODEL = "gemini-2.0-flash-exp"
 VOICE_NAME = "Puck"
 SEND_SAMPLE_RATE = 16000
 
+# Client -> Gemini audio buffering (see audio_pipeline.py)
+AUDIO_FRAME_MS = int(os.getenv("AUDIO_FRAME_MS", "100"))  # coalesced frame size sent to Gemini
+AUDIO_MAX_QUEUE_MS = int(os.getenv("AUDIO_MAX_QUEUE_MS", "2000"))  # cap on buffered audio per session
+AUDIO_OVERFLOW_POLICY = os.getenv("AUDIO_OVERFLOW_POLICY", "drop_oldest")  # drop_oldest | drop_newest | block
+
+# How user context reaches a new Live session:
+#   "refine" - open the Live session with the base instruction while the user's
+#              context is fetched, then send the context as the first turn
+#   "inline" - fetch the context first and bake it into the system instruction
+CONNECT_CONTEXT_MODE = os.getenv("CONNECT_CONTEXT_MODE", "refine")
+
+# Live API session resumption handles a client may present on reconnect (handle -> uid)
+SESSION_HANDLE_CACHE_SIZE = int(os.getenv("SESSION_HANDLE_CACHE_SIZE", "10000"))
+SESSION_HANDLE_TTL = float(os.getenv("SESSION_HANDLE_TTL", str(2 * 3600)))  # seconds; Gemini keeps handles ~2h
+
+# Vector store backend for RAG: "pinecone" (remote) or "local" (in-process, memory-mapped NumPy)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.dirname(__file__), "local_index"))
+# Namespace the uploader writes to and RAG retrieval reads from
+VECTOR_NAMESPACE = os.getenv("VECTOR_NAMESPACE", "medical-chatbot")
+
+# Embedding model shared by RAG retrieval and the Pinecone uploader
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2")
+# Inference backend: "torch" (fp32), "torch-int8" (dynamic quantization), "onnx" or "onnx-int8".
+# ONNX comes from the sentence-transformers[onnx] extra in requirements.txt. Check a new backend
+# with benchmark_embeddings.py.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# Quantized ONNX file in the model repo used by "onnx-int8"
+EMBEDDING_ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+# Load and warm up the embedding model at server startup instead of on the first tool call
+EMBEDDING_PRELOAD = os.getenv("EMBEDDING_PRELOAD", "true").lower() in ("1", "true", "yes")
+# Threads used to run query encodes off the event loop
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+# Concurrent query encodes are coalesced for up to this long (0 disables batching)
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+
+# Node.js db-server
+DB_SERVER_URL = os.getenv("DB_SERVER_URL", "http://localhost:3000")
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "5"))  # seconds per attempt
+DB_MAX_RETRIES = int(os.getenv("DB_MAX_RETRIES", "2"))
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "32"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "32"))  # keep-alive connections
+
+# Background summarization (see summary_queue.py)
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))  # cap on concurrent summarizer calls
+SUMMARY_MAX_RETRIES = int(os.getenv("SUMMARY_MAX_RETRIES", "3"))
+SUMMARY_SPOOL_DIR = os.getenv("SUMMARY_SPOOL_DIR", os.path.join(os.path.dirname(__file__), "summary_spool"))
+# Rolling summarization: condense every N completed turns during the session (0 disables)
+SUMMARY_CHUNK_TURNS = int(os.getenv("SUMMARY_CHUNK_TURNS", "40"))
+SUMMARY_CHUNK_CONCURRENCY = int(os.getenv("SUMMARY_CHUNK_CONCURRENCY", "4"))  # across all sessions
+
+# Multi-process mode (see supervisor.py): workers share the port via SO_REUSEPORT
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "2"))  # seconds
+WORKER_HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "30"))  # restart a worker silent this long
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "60"))  # seconds to finish queued summaries on shutdown
+
+# Prometheus-style metrics on http://METRICS_HOST:METRICS_PORT/metrics (0 disables);
+# in multi-worker mode worker N serves on METRICS_PORT + N
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Session transcripts, persisted turn by turn as JSONL (see session_state.py)
+TRANSCRIPT_DIR = os.getenv("TRANSCRIPT_DIR", os.path.join(os.path.dirname(__file__), "transcripts"))
+# A transcript is deleted once its session's summary is stored; files older than this whose
+# summary never completed are pruned every TRANSCRIPT_PRUNE_INTERVAL seconds
+TRANSCRIPT_RETENTION_DAYS = float(os.getenv("TRANSCRIPT_RETENTION_DAYS", "7"))
+TRANSCRIPT_PRUNE_INTERVAL = float(os.getenv("TRANSCRIPT_PRUNE_INTERVAL", "3600"))
+
+# Follow-up questions precomputed from each user's latest summary (see followup_cache.py)
+FOLLOWUP_CACHE_DIR = os.getenv("FOLLOWUP_CACHE_DIR", os.path.join(os.path.dirname(__file__), "followup_cache"))
+FOLLOWUP_CACHE_SIZE = int(os.getenv("FOLLOWUP_CACHE_SIZE", "10000"))
+FOLLOWUP_CACHE_TTL = float(os.getenv("FOLLOWUP_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+
+# RAG query caches (LRU + TTL, keyed on normalized query text)
+RAG_CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", "1024"))
+RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "3600"))  # seconds
+RAG_EMBEDDING_CACHE_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "4096"))
+# Cosine similarity above which a paraphrased query reuses a cached result; 0 disables
+RAG_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0"))
+
 def read_text_file_best_effort(path: str) -> str:
     tried = []
     for enc in ("utf-8", "utf-8-sig", "cp1252", "latin-1"):
@@ -43,73 +123,159 @@ except FileNotFoundError:
     logger.error("Error: system_instruction.txt not found. Using a default instruction.")
     SYSTEM_INSTRUCTION = "You are a helpful AI assistant."
 
+# Clients, the Pinecone index and tool objects are created on first use, not at
+# import time, so importing config never touches the network or credentials.
+# The module-level names (config.client, config.index, ...) still work through
+# __getattr__ below.
+_lock = threading.RLock()
+_resolved = {}
+
+def _cached(name, factory):
+    value = _resolved.get(name)
+    if value is None:
+        with _lock:
+            value = _resolved.get(name)
+            if value is None:
+                value = factory()
+                _resolved[name] = value
+    return value
+
 # Authorization
 KEY_PATH = os.path.join(os.path.dirname(__file__), "service-account.json")
 SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
-creds = service_account.Credentials.from_service_account_file(KEY_PATH, scopes=SCOPES)
-# REMOVED: Redundant environment variable setting
-client = genai.Client(
-    vertexai=True,
-    project=PROJECT_ID,
-    location=LOCATION,
-    credentials=creds,
-)
+
+def get_credentials():
+    def factory():
+        from google.oauth2 import service_account
+        return service_account.Credentials.from_service_account_file(KEY_PATH, scopes=SCOPES)
+    return _cached("creds", factory)
+
+def get_client():
+    def factory():
+        from google import genai
+        return genai.Client(
+            vertexai=True,
+            project=PROJECT_ID,
+            location=LOCATION,
+            credentials=get_credentials(),
+        )
+    return _cached("client", factory)
 
 # Initialize Pinecone
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY", "your-pinecone-api-key")
 index_name = os.getenv("PINECONE_INDEX_NAME", "medical-chatbot")
-# print(PINECONE_API_KEY)
-pc = Pinecone(api_key=PINECONE_API_KEY)
+# Set to false to skip the list_indexes()/create_index round trip when the index is known to exist
+PINECONE_ENSURE_INDEX = os.getenv("PINECONE_ENSURE_INDEX", "true").lower() in ("1", "true", "yes")
+
+def get_pinecone():
+    def factory():
+        from pinecone import Pinecone
+        return Pinecone(api_key=PINECONE_API_KEY)
+    return _cached("pc", factory)
+
+def get_index():
+    def factory():
+        pc = get_pinecone()
+        # Checked once per process, on first use
+        if PINECONE_ENSURE_INDEX and index_name not in pc.list_indexes().names():
+            from pinecone import ServerlessSpec
+            pc.create_index(
+                name=index_name,
+                dimension=768,  # Dimension of the embeddings (matches all-mpnet-base-v2)
+                metric="cosine",  # Cosine similarity
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")
+            )
+        return pc.Index(index_name)
+    return _cached("index", factory)
+
+# Async index client used by the WebSocket server (requires pinecone[asyncio]).
+# Created on first use because it must be bound to the running event loop.
+_async_index = None
 
-# UPDATED: More modern way to check for index existence
-if index_name not in pc.list_indexes().names():
-    pc.create_index(
-        name=index_name,
-        dimension=768,  # Dimension of the embeddings (matches all-mpnet-base-v2)
-        metric="cosine",  # Cosine similarity
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
+async def get_async_index():
+    global _async_index
+    if _async_index is None:
+        # These are blocking HTTP calls; keep them off the event loop
+        await asyncio.to_thread(get_index)
+        description = await asyncio.to_thread(get_pinecone().describe_index, index_name)
+        if _async_index is None:
+            _async_index = get_pinecone().IndexAsyncio(host=description.host)
+    return _async_index
 
-index = pc.Index(index_name)
+async def close_async_index():
+    global _async_index
+    if _async_index is not None:
+        await _async_index.close()
+        _async_index = None
 
 # Define tool objects
 
-# RAG Tool for mental health resources
-rag_tool = genai.types.Tool(
-    function_declarations=[
-        genai.types.FunctionDeclaration(
-            name="medical-chatbot",
-            description="Provide information",
-            parameters=genai.types.Schema(
-                type=genai.types.Type.OBJECT,
-                properties={
-                    "query": genai.types.Schema(
-                        type=genai.types.Type.STRING,
-                        description="The user's query/topic."
-                    )
-                },
-                required=["query"]
-            ),
+# RAG Tool for mental health resources; the server dispatches tool calls by this name
+RAG_TOOL_NAME = "retrieve_mental_health_resources"
+
+def get_rag_tool():
+    def factory():
+        from google import genai
+        return genai.types.Tool(
+            function_declarations=[
+                genai.types.FunctionDeclaration(
+                    name=RAG_TOOL_NAME,
+                    description="Provide information",
+                    parameters=genai.types.Schema(
+                        type=genai.types.Type.OBJECT,
+                        properties={
+                            "query": genai.types.Schema(
+                                type=genai.types.Type.STRING,
+                                description="The user's query/topic."
+                            )
+                        },
+                        required=["query"]
+                    ),
+                )
+            ]
         )
-    ]
-)
+    return _cached("rag_tool", factory)
 
 # CORRECTED: Single, correct definition for the Google Search tool
-google_search_tool = genai.types.Tool(
-    google_search_retrieval=genai.types.GoogleSearchRetrieval()
-)
+def get_google_search_tool():
+    def factory():
+        from google import genai
+        return genai.types.Tool(
+            google_search_retrieval=genai.types.GoogleSearchRetrieval()
+        )
+    return _cached("google_search_tool", factory)
 
 # LiveAPI Configuration
-config = genai.types.LiveConnectConfig(
-    response_modalities=["AUDIO"],
-    output_audio_transcription={},
-    input_audio_transcription={},
-    speech_config=genai.types.SpeechConfig(
-        voice_config=genai.types.VoiceConfig(
-            prebuilt_voice_config=genai.types.PrebuiltVoiceConfig(voice_name=VOICE_NAME)
+def get_live_config():
+    def factory():
+        from google import genai
+        return genai.types.LiveConnectConfig(
+            response_modalities=["AUDIO"],
+            output_audio_transcription={},
+            input_audio_transcription={},
+            speech_config=genai.types.SpeechConfig(
+                voice_config=genai.types.VoiceConfig(
+                    prebuilt_voice_config=genai.types.PrebuiltVoiceConfig(voice_name=VOICE_NAME)
+                )
+            ),
+            session_resumption=genai.types.SessionResumptionConfig(handle=None),
+            system_instruction=SYSTEM_INSTRUCTION,
+            tools=[get_rag_tool(), get_google_search_tool()],
         )
-    ),
-    session_resumption=genai.types.SessionResumptionConfig(handle=None),
-    system_instruction=SYSTEM_INSTRUCTION,
-    tools=[rag_tool, google_search_tool],
-)
\ No newline at end of file
+    return _cached("config", factory)
+
+_LAZY_ATTRIBUTES = {
+    "creds": get_credentials,
+    "client": get_client,
+    "pc": get_pinecone,
+    "index": get_index,
+    "rag_tool": get_rag_tool,
+    "google_search_tool": get_google_search_tool,
+    "config": get_live_config,
+}
+
+def __getattr__(name):
+    # Backwards compatible `from config import client, index, ...`
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
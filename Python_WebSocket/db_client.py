@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import random
+import time
+import aiohttp
+from config import DB_SERVER_URL, DB_TIMEOUT, DB_MAX_RETRIES, DB_MAX_CONCURRENCY, DB_POOL_SIZE
+from metrics import DB_LATENCY
+
+logger = logging.getLogger(__name__)
+
+class DBClientError(Exception):
+    """Raised when the db-server cannot be reached or keeps failing."""
+
+class DBClient:
+    """
+    Shared async HTTP client for the Node.js db-server.
+    One keep-alive connection pool per process, with per-call timeouts,
+    retries with exponential backoff and a cap on in-flight requests.
+    """
+
+    def __init__(self, base_url=DB_SERVER_URL, timeout=DB_TIMEOUT,
+                 max_retries=DB_MAX_RETRIES, max_concurrency=DB_MAX_CONCURRENCY):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=DB_POOL_SIZE, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request(self, method: str, path: str, json=None, timeout=None, route=None):
+        """
+        Returns (status, body) where body is parsed JSON when possible, else text.
+        `route` labels the latency metric; pass it when `path` contains ids.
+        """
+        started = time.perf_counter()
+        try:
+            status, body = await self._send(method, path, json, timeout)
+        except DBClientError:
+            DB_LATENCY.observe(time.perf_counter() - started, route=route or path, outcome="error")
+            raise
+        DB_LATENCY.observe(time.perf_counter() - started, route=route or path, outcome=f"{status // 100}xx")
+        return status, body
+
+    async def _send(self, method: str, path: str, json, timeout):
+        url = f"{self.base_url}{path}"
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    async with self._get_session().request(method, url, json=json, timeout=client_timeout) as response:
+                        if response.status >= 500 and attempt < self.max_retries:
+                            last_error = DBClientError(f"{method} {path} returned {response.status}")
+                        else:
+                            try:
+                                body = await response.json(content_type=None)
+                            except ValueError:
+                                body = await response.text()
+                            return response.status, body
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+
+            if attempt < self.max_retries:
+                delay = 0.2 * (2 ** attempt) + random.uniform(0, 0.1)
+                logger.warning(f"db-server {method} {path} failed ({last_error}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+        raise DBClientError(f"{method} {path} failed after {self.max_retries + 1} attempts: {last_error}")
+
+    async def get_user(self, uid: str):
+        """Returns the user document, or None if the db-server did not return 200."""
+        status, body = await self._request("GET", f"/user/{uid}", route="/user/{uid}")
+        if status != 200:
+            logger.error(f"Failed to fetch user data for UID {uid}. Status: {status}")
+            return None
+        return body
+
+    async def get_summary(self, uid: str):
+        status, body = await self._request("GET", f"/get-summary/{uid}", route="/get-summary/{uid}")
+        if status != 200:
+            logger.error(f"Failed to fetch previous summary for UID {uid}. Status: {status}")
+            return None
+        return body
+
+    async def _post(self, path: str, payload: dict):
+        status, body = await self._request("POST", path, json=payload)
+        if status >= 400:
+            raise DBClientError(f"POST {path} returned {status}: {body}")
+        return body
+
+    async def save_summary(self, payload: dict):
+        return await self._post("/save-summary", payload)
+
+    async def save_name(self, uid: str, name: str):
+        return await self._post("/save-name", {"uid": uid, "name": name})
+
+    async def save_exercises(self, uid: str, exercise_ids: list):
+        return await self._post("/save-exercises", {"uid": uid, "exerciseIds": exercise_ids})
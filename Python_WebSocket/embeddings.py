@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_ONNX_INT8_FILE, EMBEDDING_WORKERS,
+    EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_MAX_BATCH,
+)
+from metrics import EMBED_BATCH_SIZE, EMBED_MODEL_LOAD, EMBED_WARMUP
+
+logger = logging.getLogger(__name__)
+
+_model = None
+_model_lock = threading.Lock()
+
+# Bounded pool so concurrent tool calls can't oversubscribe the CPU
+_executor = ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embed")
+
+def _load_model(name: str, backend: str):
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(name)
+    if backend == "torch-int8":
+        import torch
+
+        model = SentenceTransformer(name, device="cpu")
+        # Linear layers are most of the compute; weights go to int8, activations stay fp32
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        return SentenceTransformer(name, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(name, backend="onnx", model_kwargs={"file_name": EMBEDDING_ONNX_INT8_FILE})
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+
+def get_embedding_model():
+    """
+    Return the process-wide SentenceTransformer, loading it on first use.
+    Every caller (RAG tool, uploader, test scripts) shares this one instance.
+    """
+    global _model
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is None:
+            start = time.perf_counter()
+            _model = _load_model(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+            load_seconds = time.perf_counter() - start
+            EMBED_MODEL_LOAD.set(load_seconds, backend=EMBEDDING_BACKEND)
+            logger.info(
+                f"Loaded embedding model '{EMBEDDING_MODEL_NAME}' ({EMBEDDING_BACKEND}) in {load_seconds:.2f}s"
+            )
+    return _model
+
+def encode(texts, **kwargs):
+    """Encode a string or list of strings with the shared model."""
+    return get_embedding_model().encode(texts, **kwargs)
+
+class EmbeddingBatcher:
+    """
+    Coalesces single-query encodes from concurrent sessions into one batched
+    encode on the embedding executor. An idle batcher encodes a query right
+    away; while a batch is running, new queries wait up to `window` seconds
+    (or until the batch finishes, or `max_batch` are waiting) and go together.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []  # (text, future)
+        self._timer = None
+        self._in_flight = 0
+        self._tasks = set()
+
+    def submit(self, text: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if self._in_flight == 0 or len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Callers that gave up (e.g. a cancelled tool call) don't need encoding
+        self._pending = [(text, future) for text, future in self._pending if not future.done()]
+        if not self._pending:
+            return
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        self._in_flight += 1
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if self._pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    async def _run(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(_executor, lambda: encode(texts))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+            EMBED_BATCH_SIZE.observe(len(batch))
+        finally:
+            self._in_flight -= 1
+            # Whatever queued up behind this batch goes next
+            if self._pending and self._in_flight == 0:
+                self._flush()
+
+_batcher = None
+
+async def aencode(texts, **kwargs):
+    """
+    Encode on the embedding executor so the event loop keeps relaying audio.
+    Single queries go through the batcher, so concurrent tool calls share one encode.
+    """
+    global _batcher
+    if isinstance(texts, str) and not kwargs and EMBEDDING_BATCH_WINDOW_MS > 0:
+        if _batcher is None:
+            _batcher = EmbeddingBatcher(EMBEDDING_BATCH_WINDOW_MS / 1000, max(1, EMBEDDING_MAX_BATCH))
+        return await _batcher.submit(texts)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, lambda: encode(texts, **kwargs))
+
+def warm_up():
+    """Load the model and run one throwaway encode so the first real query is fast."""
+    start = time.perf_counter()
+    encode("warm-up")
+    warmup_seconds = time.perf_counter() - start
+    EMBED_WARMUP.set(warmup_seconds, backend=EMBEDDING_BACKEND)
+    logger.info(f"Embedding model warmed up in {warmup_seconds:.2f}s")
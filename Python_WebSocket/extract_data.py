@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
-import os, sys, json, argparse, logging, uuid
+import os, sys, json, argparse, logging, hashlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Iterable, List, Optional, Tuple
 import xml.etree.ElementTree as ET
 
-# ---------- Logging ----------
-logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+# Optional faster parser; ElementTree is used when lxml isn't installed
+try:
+    from lxml import etree as LET
+except ImportError:
+    LET = None
 
 # ---------- Helpers ----------
 def to_text(elem: Optional[ET.Element]) -> str:
@@ -26,21 +31,24 @@ def findtext(root: ET.Element, path: str) -> str:
     return el.text.strip() if (el is not None and el.text) else ""
 
 def iter_xml_files(resources_dir: Path) -> Iterable[Path]:
-    for p in resources_dir.rglob("*.xml"):
+    # Sorted so output order is stable across runs and worker counts
+    for p in sorted(resources_dir.rglob("*.xml")):
         yield p
 
+def parse_root(xml_path: Path, parser: str = "etree"):
+    if parser == "lxml" and LET is not None:
+        return LET.parse(str(xml_path)).getroot()
+    return ET.parse(xml_path).getroot()
+
+def vector_id(qa) -> str:
+    """Id of the vector a Q&A record is stored under (shared with upload_to_pinecone.py)."""
+    return qa.get('qid', '') or f"{qa.get('document_id', '')}_{qa.get('pid', '')}"
+
 # ---------- Core extraction ----------
-def extract_doc_qa_records(xml_path: Path, lang: str = "en") -> Iterable[dict]:
+def qa_records_from_root(root, xml_path: Path, lang: str = "en") -> Iterable[dict]:
     """
     Yields one JSONL record per QA pair (doc_type='qa') for RAG-friendly ingestion.
     """
-    try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-    except Exception as e:
-        logging.warning(f"Skipping {xml_path}: {e}")
-        return
-
     document_id = safe_attr(root, "id", xml_path.stem)
     source = safe_attr(root, "source", "")
     url = safe_attr(root, "url", "")
@@ -66,7 +74,9 @@ def extract_doc_qa_records(xml_path: Path, lang: str = "en") -> Iterable[dict]:
         qid = safe_attr(q_el, "qid", "")
         pid = safe_attr(qa, "pid", "")
 
-        rid = f"{document_id}:{qid or uuid.uuid4().hex}"
+        # Deterministic, so re-extracting an unchanged pair yields the same id
+        local_id = qid or (f"pid-{pid}" if pid else hashlib.sha1(question.encode("utf-8")).hexdigest()[:16])
+        rid = f"{document_id}:{local_id}"
         yield {
             "id": rid,
             "doc_type": "qa",
@@ -86,17 +96,10 @@ def extract_doc_qa_records(xml_path: Path, lang: str = "en") -> Iterable[dict]:
             "answer": answer,
         }
 
-def extract_doc_meta_record(xml_path: Path, lang: str = "en") -> Optional[dict]:
+def meta_record_from_root(root, xml_path: Path, lang: str = "en") -> dict:
     """
     One metadata record per document (doc_type='doc_meta') for auditing/citation.
     """
-    try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-    except Exception as e:
-        logging.warning(f"Skipping meta {xml_path}: {e}")
-        return None
-
     document_id = safe_attr(root, "id", xml_path.stem)
     source = safe_attr(root, "source", "")
     url = safe_attr(root, "url", "")
@@ -115,6 +118,36 @@ def extract_doc_meta_record(xml_path: Path, lang: str = "en") -> Optional[dict]:
         "last_reviewed_date": last_reviewed or None,
     }
 
+def extract_doc_records(xml_path: Path, lang: str = "en", parser: str = "etree") -> Tuple[List[dict], Optional[dict]]:
+    """
+    Parses the file once and returns (qa_records, meta_record).
+    Top-level so it can run in a process pool.
+    """
+    try:
+        root = parse_root(xml_path, parser)
+    except Exception as e:
+        logging.warning(f"Skipping {xml_path}: {e}")
+        return [], None
+    return list(qa_records_from_root(root, xml_path, lang)), meta_record_from_root(root, xml_path, lang)
+
+def extract_doc_qa_records(xml_path: Path, lang: str = "en") -> Iterable[dict]:
+    qa_records, _ = extract_doc_records(xml_path, lang)
+    yield from qa_records
+
+def extract_doc_meta_record(xml_path: Path, lang: str = "en") -> Optional[dict]:
+    _, meta = extract_doc_records(xml_path, lang)
+    return meta
+
+def iter_extracted(xml_files: Iterable[Path], lang: str = "en", parser: str = "etree",
+                   workers: int = 1) -> Iterable[Tuple[List[dict], Optional[dict]]]:
+    """Extract files across `workers` processes, yielding results in input order."""
+    extract = partial(extract_doc_records, lang=lang, parser=parser)
+    if workers <= 1:
+        yield from map(extract, xml_files)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(extract, xml_files, chunksize=16)
+
 # ---------- Writers ----------
 def write_jsonl(records: Iterable[dict], out_path: Path) -> int:
     out_path.parent.mkdir(parents=True, exist_ok=True)
@@ -125,35 +158,158 @@ def write_jsonl(records: Iterable[dict], out_path: Path) -> int:
             n += 1
     return n
 
+# ---------- Manifest ----------
+# The manifest maps each XML file (relative to --resources) to its
+# mtime/size/content hash and the record ids it produced, so re-runs only
+# parse new or changed files.
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest(path: Path) -> dict:
+    if path.exists():
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}}
+
+def save_manifest(manifest: dict, path: Path):
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+def plan_changes(resources_dir: Path, manifest: dict):
+    """
+    Returns (changed, unchanged, deleted): changed is a list of (rel, path, fingerprint)
+    to (re)parse, unchanged maps rel -> manifest entry, deleted lists rels that are gone.
+    Files whose mtime and size match are trusted without hashing.
+    """
+    known = manifest.get("files", {})
+    changed, unchanged = [], {}
+    for xmlp in iter_xml_files(resources_dir):
+        rel = xmlp.relative_to(resources_dir).as_posix()
+        st = xmlp.stat()
+        entry = known.get(rel)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            unchanged[rel] = entry
+            continue
+        digest = sha256_file(xmlp)
+        fingerprint = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest}
+        if entry and entry["sha256"] == digest:
+            # Touched but identical content
+            unchanged[rel] = {**entry, **fingerprint}
+            continue
+        changed.append((rel, xmlp, fingerprint))
+    seen = set(unchanged) | {rel for rel, _, _ in changed}
+    deleted = [rel for rel in known if rel not in seen]
+    return changed, unchanged, deleted
+
+def iter_jsonl_file(path: Path) -> Iterable[dict]:
+    if not path.exists():
+        return
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
 # ---------- CLI ----------
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
     ap = argparse.ArgumentParser(description="Extract QA pairs from XML into RAG-ready JSONL.")
     ap.add_argument("--resources", "-r", default="Resources", help="Directory containing XML files")
     ap.add_argument("--out-jsonl", "-o", default="medical_qa.jsonl", help="Output JSONL (QA records)")
     ap.add_argument("--out-meta", "-m", default="medical_docs_meta.jsonl", help="Output JSONL (doc meta)")
     ap.add_argument("--lang", default="en", help="Language tag for the extracted content (e.g., en, hi)")
+    ap.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 1, help="Parallel extraction processes")
+    ap.add_argument("--parser", choices=("etree", "lxml"), default="lxml" if LET is not None else "etree",
+                    help="XML parser (lxml is faster when installed)")
+    ap.add_argument("--manifest", default="extract_manifest.json", help="File fingerprint manifest for incremental runs")
+    ap.add_argument("--out-delta", "-d", default="medical_delta.jsonl",
+                    help="Output JSONL of upsert/delete ops for QA records changed by this run")
+    ap.add_argument("--full", action="store_true", help="Ignore the manifest and reprocess every file")
     args = ap.parse_args()
 
+    if args.parser == "lxml" and LET is None:
+        logging.warning("lxml is not installed; falling back to ElementTree")
+        args.parser = "etree"
+
     resources_dir = Path(args.resources)
     qa_out = Path(args.out_jsonl)
     meta_out = Path(args.out_meta)
+    manifest_path = Path(args.manifest)
+    delta_out = Path(args.out_delta)
+
+    # Incremental only if the previous outputs are still there to patch
+    manifest = {"files": {}}
+    if not args.full and qa_out.exists() and meta_out.exists():
+        manifest = load_manifest(manifest_path)
+    changed, unchanged, deleted = plan_changes(resources_dir, manifest)
+    logging.info(f"{len(changed)} new/changed, {len(unchanged)} unchanged, {len(deleted)} deleted XML files")
+
+    # Ids produced last time by files that changed or disappeared
+    stale_ids = set()
+    for rel in [rel for rel, _, _ in changed] + deleted:
+        stale_ids.update(manifest["files"].get(rel, {}).get("ids", []))
+
+    new_files = dict(unchanged)
+    removed_qa = {}  # vector id -> last record of a QA pair whose file changed or vanished
+    live_vector_ids = set()  # vector ids still present after this run
+    n_qa = n_meta = n_upserts = 0
+    for out in (qa_out, meta_out, delta_out):
+        out.parent.mkdir(parents=True, exist_ok=True)
+    qa_tmp = qa_out.with_name(qa_out.name + ".tmp")
+    meta_tmp = meta_out.with_name(meta_out.name + ".tmp")
+    with qa_tmp.open("w", encoding="utf-8") as qa_f, meta_tmp.open("w", encoding="utf-8") as meta_f, \
+            delta_out.open("w", encoding="utf-8") as delta_f:
+        # Carry over records from unchanged files
+        if stale_ids or unchanged:
+            for r in iter_jsonl_file(qa_out):
+                if r["id"] in stale_ids:
+                    removed_qa[vector_id(r)] = r
+                    continue
+                qa_f.write(json.dumps(r, ensure_ascii=False) + "\n")
+                live_vector_ids.add(vector_id(r))
+                n_qa += 1
+            for r in iter_jsonl_file(meta_out):
+                if r["id"] in stale_ids:
+                    continue
+                meta_f.write(json.dumps(r, ensure_ascii=False) + "\n")
+                n_meta += 1
 
-    # Stream QA
-    def qa_stream():
-        for xmlp in iter_xml_files(resources_dir):
-            yield from extract_doc_qa_records(xmlp, lang=args.lang)
+        # One pass over new/changed files: each is parsed once and feeds both outputs
+        results = iter_extracted((xmlp for _, xmlp, _ in changed), lang=args.lang, parser=args.parser, workers=args.workers)
+        for (rel, _, fingerprint), (qa_records, meta) in zip(changed, results):
+            ids = []
+            for r in qa_records:
+                line = json.dumps(r, ensure_ascii=False)
+                qa_f.write(line + "\n")
+                delta_f.write(json.dumps({"op": "upsert", "record": r}, ensure_ascii=False) + "\n")
+                ids.append(r["id"])
+                live_vector_ids.add(vector_id(r))
+            n_qa += len(qa_records)
+            n_upserts += len(qa_records)
+            if meta:
+                meta_f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+                ids.append(meta["id"])
+                n_meta += 1
+            new_files[rel] = {**fingerprint, "ids": ids}
 
-    # Stream meta
-    def meta_stream():
-        for xmlp in iter_xml_files(resources_dir):
-            rec = extract_doc_meta_record(xmlp, lang=args.lang)
-            if rec:
-                yield rec
+        # Vectors whose QA pair is gone everywhere; an edited or moved pair keeps its vector id
+        n_deletes = 0
+        for vid, r in removed_qa.items():
+            if vid not in live_vector_ids:
+                delta_f.write(json.dumps({"op": "delete", "record": r}, ensure_ascii=False) + "\n")
+                n_deletes += 1
 
-    n_qa = write_jsonl(qa_stream(), qa_out)
-    n_meta = write_jsonl(meta_stream(), meta_out)
+    os.replace(qa_tmp, qa_out)
+    os.replace(meta_tmp, meta_out)
+    save_manifest({"files": new_files}, manifest_path)
     logging.info(f"Wrote {n_qa} QA records → {qa_out}")
     logging.info(f"Wrote {n_meta} meta records → {meta_out}")
+    logging.info(f"Wrote delta with {n_upserts} upserts and {n_deletes} deletes → {delta_out}")
 
 if __name__ == "__main__":
     main()
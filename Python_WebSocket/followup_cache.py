@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from cache import TTLLRUCache
+from config import FOLLOWUP_CACHE_DIR, FOLLOWUP_CACHE_SIZE, FOLLOWUP_CACHE_TTL
+from utils import ensure_dir
+
+logger = logging.getLogger(__name__)
+
+def summary_version(summary) -> str:
+    """
+    Version of a saved summary ({"summary_data", "meta"}); cached questions are only valid for it.
+    meta.saved_at_utc is written once, as a string, when the summary is saved, so it comes back
+    from the database unchanged, unlike summary_data's numbers and timestamps.
+    """
+    saved_at = (summary.get("meta") or {}).get("saved_at_utc")
+    if saved_at:
+        return str(saved_at)
+    # Summaries saved without meta: fall back to the content
+    payload = json.dumps(summary.get("summary_data") or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+class FollowupQuestionCache:
+    """
+    Per-user follow-up questions generated from their latest summary.
+    An in-memory LRU sits in front of one small JSON file per user, so the
+    questions survive restarts and are shared by reconnects.
+    """
+
+    def __init__(self, directory=FOLLOWUP_CACHE_DIR, maxsize=FOLLOWUP_CACHE_SIZE, ttl=FOLLOWUP_CACHE_TTL):
+        self.directory = directory
+        self._memory = TTLLRUCache(maxsize=maxsize, ttl=ttl)
+        ensure_dir(directory)
+
+    def _path(self, uid: str) -> str:
+        # uids come from clients; never use them as file names directly
+        return os.path.join(self.directory, hashlib.sha1(uid.encode("utf-8")).hexdigest() + ".json")
+
+    def _read(self, uid: str):
+        try:
+            with open(self._path(uid), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, uid: str, entry: dict):
+        path = self._path(uid)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    async def get(self, uid: str, version: str):
+        """Cached questions for this summary version, or None."""
+        entry = self._memory.get(uid)
+        if entry is None:
+            entry = await asyncio.to_thread(self._read, uid)
+            if entry is not None:
+                self._memory.set(uid, entry)
+        if entry and entry.get("version") == version:
+            return entry.get("questions")
+        return None
+
+    async def put(self, uid: str, version: str, questions: str):
+        entry = {"version": version, "questions": questions}
+        self._memory.set(uid, entry)
+        try:
+            await asyncio.to_thread(self._write, uid, entry)
+        except OSError as e:
+            logger.error(f"Error persisting follow-up questions for UID {uid}: {e}")
+
+    def stats(self) -> dict:
+        return self._memory.stats()
@@ -0,0 +1,423 @@
+"""
+Load test for LiveAPIWebSocketServer against a fake Gemini Live backend.
+
+The server runs in a child process with client.aio.live.connect, the text
+model, the db-server and (unless --real-rag) RAG retrieval replaced by local
+fakes. The parent drives N WebSocket clients that stream PCM in real time.
+Audio chunks carry their send time in the first 8 bytes, so relay latency is
+measured in both directions:
+  uplink   - client send -> fake Live session receives the frame (includes coalescing)
+  downlink - fake Live session emits a chunk -> client receives it
+
+    python load_test.py --clients 200 --duration 60 --protocol binary
+"""
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+sys.path.insert(0, os.path.dirname(__file__))
+from protocol import PROTOCOL_BINARY, FRAME_AUDIO, pack_frame, unpack_frame
+
+STAMP = struct.Struct("!d")  # send time (time.time()) at the start of each audio chunk
+CLIENT_SAMPLE_RATE = 16000
+MODEL_SAMPLE_RATE = 24000
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def stamped_pcm(n_bytes: int) -> bytes:
+    return STAMP.pack(time.time()) + bytes(max(0, n_bytes - STAMP.size))
+
+def latency_of(payload: bytes):
+    if len(payload) < STAMP.size:
+        return None
+    return time.time() - STAMP.unpack_from(payload)[0]
+
+def rss_bytes():
+    """Current resident set size of this process (Linux), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+# ---------- Fakes (server process) ----------
+
+# Tool calls made by fake sessions in this process: emitted -> answered via send_tool_response
+tool_calls = {"made": 0, "answered": 0, "round_trips": []}
+
+def _response(**server_content):
+    content = dict(interrupted=False, model_turn=None, turn_complete=False,
+                   output_transcription=None, input_transcription=None)
+    content.update(server_content)
+    return SimpleNamespace(session_resumption_update=None, go_away=None, tool_call=None,
+                           server_content=SimpleNamespace(**content))
+
+def _tool_call_message(call):
+    # Like the Live API, a tool call is its own message with no server_content
+    return SimpleNamespace(session_resumption_update=None, go_away=None, server_content=None,
+                           tool_call=SimpleNamespace(function_calls=[call]))
+
+class FakeLiveSession:
+    """
+    Plays a scripted conversation: after each `turn_seconds` of client audio it
+    transcribes the user, optionally makes a tool call and waits for its result,
+    then streams `reply_seconds` of model audio in real time, sometimes interrupted.
+    """
+
+    def __init__(self, opts, uplink_latencies):
+        self.opts = opts
+        self.uplink_latencies = uplink_latencies
+        self._out = asyncio.Queue()
+        self._heard_ms = 0.0
+        self._reply = None
+        self._tool_results = {}
+        self._out.put_nowait(SimpleNamespace(
+            session_resumption_update=SimpleNamespace(resumable=True, new_handle=uuid.uuid4().hex),
+            go_away=None, server_content=None, tool_call=None,
+        ))
+
+    async def send_client_content(self, **kwargs):
+        pass
+
+    async def send_tool_response(self, function_responses):
+        for function_response in function_responses:
+            waiter = self._tool_results.get(function_response.id)
+            if waiter:
+                waiter.set()
+
+    async def send_realtime_input(self, media=None, text=None, **kwargs):
+        if media is not None:
+            data = media["data"]
+            latency = latency_of(data)
+            if latency is not None:
+                self.uplink_latencies.append(latency)
+            self._heard_ms += len(data) / (CLIENT_SAMPLE_RATE * 2 / 1000)
+        if text is not None:
+            self._heard_ms = self.opts.turn_seconds * 1000
+        if self._heard_ms >= self.opts.turn_seconds * 1000 and (self._reply is None or self._reply.done()):
+            self._heard_ms = 0.0
+            self._reply = asyncio.create_task(self._play_reply())
+
+    async def _play_reply(self):
+        opts = self.opts
+        for word in ("I", " have", " been", " feeling", " tired"):
+            self._out.put_nowait(_response(input_transcription=SimpleNamespace(text=word)))
+        if random.random() < opts.tool_rate:
+            from config import RAG_TOOL_NAME  # after _server_main has pointed config at the scratch dirs
+            call_id = uuid.uuid4().hex
+            waiter = self._tool_results[call_id] = asyncio.Event()
+            call = SimpleNamespace(name=RAG_TOOL_NAME, id=call_id, args={"query": "coping with fatigue"})
+            self._out.put_nowait(_tool_call_message(call))
+            tool_calls["made"] += 1
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(waiter.wait(), 10)
+                tool_calls["answered"] += 1
+                tool_calls["round_trips"].append(time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                pass
+            self._tool_results.pop(call_id, None)
+
+        chunk_bytes = int(MODEL_SAMPLE_RATE * 2 * opts.chunk_ms / 1000)
+        n_chunks = max(1, int(opts.reply_seconds * 1000 / opts.chunk_ms))
+        interrupt_at = random.randrange(n_chunks) if random.random() < opts.interrupt_rate else None
+        for i in range(n_chunks):
+            part = SimpleNamespace(inline_data=SimpleNamespace(data=stamped_pcm(chunk_bytes)))
+            self._out.put_nowait(_response(model_turn=SimpleNamespace(parts=[part])))
+            self._out.put_nowait(_response(output_transcription=SimpleNamespace(text=" word")))
+            if i == interrupt_at:
+                self._out.put_nowait(_response(interrupted=True))
+                return
+            await asyncio.sleep(opts.chunk_ms / 1000)
+        self._out.put_nowait(_response(turn_complete=True))
+
+    async def receive(self):
+        while True:
+            yield await self._out.get()
+
+    async def close(self):
+        if self._reply:
+            self._reply.cancel()
+
+class FakeLive:
+    def __init__(self, opts, uplink_latencies):
+        self.opts = opts
+        self.uplink_latencies = uplink_latencies
+
+    def connect(self, model, config):
+        live = self
+
+        class _Connection:
+            async def __aenter__(self):
+                await asyncio.sleep(live.opts.connect_latency)
+                self.session = FakeLiveSession(live.opts, live.uplink_latencies)
+                return self.session
+
+            async def __aexit__(self, *exc):
+                await self.session.close()
+
+        return _Connection()
+
+class FakeModels:
+    """Stands in for the text model used for summaries and follow-up questions."""
+
+    def __init__(self, opts):
+        self.opts = opts
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.opts.llm_latency)
+        text = json.dumps({"summary_of_interaction": "Load test session.", "reported_symptoms": ["fatigue"]})
+        part = SimpleNamespace(text=text)
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+class FakeGenAIClient:
+    def __init__(self, opts, uplink_latencies):
+        self.aio = SimpleNamespace(live=FakeLive(opts, uplink_latencies), models=FakeModels(opts))
+
+class FakeDB:
+    def __init__(self, opts):
+        self.opts = opts
+
+    async def _wait(self):
+        await asyncio.sleep(self.opts.db_latency)
+
+    async def get_user(self, uid):
+        await self._wait()
+        return {"name": "Load Test", "latestSummary": {"summary_data": {"summary": "Felt tired last week."}}}
+
+    async def get_summary(self, uid):
+        await self._wait()
+        return None
+
+    async def save_summary(self, payload):
+        await self._wait()
+        return {"ok": True}
+
+    async def save_name(self, uid, name):
+        await self._wait()
+        return {"ok": True}
+
+    async def save_exercises(self, uid, exercise_ids):
+        await self._wait()
+        return {"ok": True}
+
+    async def close(self):
+        pass
+
+async def _serve(opts, conn):
+    import config
+    import websocket_server
+    uplink_latencies = []
+    # get_client() returns whatever is cached under "client"
+    config._resolved["client"] = FakeGenAIClient(opts, uplink_latencies)
+    if not opts.real_rag:
+        async def fake_retrieve(query):
+            await asyncio.sleep(opts.tool_latency)
+            return "Resource 1: Rest, hydrate and keep a regular sleep schedule."
+        websocket_server.aretrieve_mental_health_resources = fake_retrieve
+
+    server = websocket_server.LiveAPIWebSocketServer("127.0.0.1", opts.port)
+    server.db = FakeDB(opts)
+    serve_task = asyncio.create_task(server.start())
+    await asyncio.sleep(0.5)
+    conn.send("ready")
+    baseline_rss = rss_bytes()
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+
+    while True:
+        command = await asyncio.to_thread(conn.recv)
+        if command == "reset":
+            uplink_latencies.clear()
+            tool_calls.update(made=0, answered=0, round_trips=[])
+        elif command == "measure":
+            # Taken while every client is still connected
+            conn.send({
+                "cpu_seconds": time.process_time() - cpu_start,
+                "wall_seconds": time.monotonic() - wall_start,
+                "baseline_rss": baseline_rss,
+                "rss": rss_bytes(),
+                "active_sessions": len(server.sessions),
+                "uplink_latencies": list(uplink_latencies),
+                "tool_calls": dict(tool_calls),
+            })
+        elif command == "stop":
+            server.request_stop()
+            await serve_task
+            conn.send("stopped")
+            return
+
+def _server_main(opts, conn):
+    # Keep the load test's transcripts, spool and caches out of the real directories
+    scratch = tempfile.mkdtemp(prefix="loadtest-")
+    for name in ("TRANSCRIPT_DIR", "SUMMARY_SPOOL_DIR", "FOLLOWUP_CACHE_DIR"):
+        os.environ[name] = os.path.join(scratch, name.lower())
+    os.environ["METRICS_PORT"] = str(opts.metrics_port)
+    os.environ["EMBEDDING_PRELOAD"] = "0"
+    import logging
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - server - %(levelname)s - %(message)s")
+    asyncio.run(_serve(opts, conn))
+
+# ---------- Clients (parent process) ----------
+
+class ClientStats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.downlink_latencies = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.messages_received = 0
+
+async def run_client(i: int, opts, stats: ClientStats, stop: asyncio.Event):
+    import websockets
+    binary = opts.protocol == PROTOCOL_BINARY
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{opts.port}", max_size=None) as ws:
+            await ws.recv()  # ready
+            await ws.send(json.dumps({"type": "user_id", "data": f"loadtest-{i}", "protocol": opts.protocol}))
+            stats.connected += 1
+
+            async def send_audio():
+                chunk_bytes = int(CLIENT_SAMPLE_RATE * 2 * opts.chunk_ms / 1000)
+                interval = opts.chunk_ms / 1000
+                next_at = time.monotonic()
+                seq = 0
+                while not stop.is_set():
+                    chunk = stamped_pcm(chunk_bytes)
+                    if binary:
+                        await ws.send(pack_frame(FRAME_AUDIO, seq, chunk))
+                        seq += 1
+                    else:
+                        await ws.send(json.dumps({"type": "audio", "data": base64.b64encode(chunk).decode("ascii")}))
+                    stats.bytes_sent += len(chunk)
+                    next_at += interval
+                    await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+            async def receive():
+                async for message in ws:
+                    stats.messages_received += 1
+                    payload = None
+                    if isinstance(message, bytes):
+                        _type, _seq, payload = unpack_frame(message)
+                    else:
+                        data = json.loads(message)
+                        if data.get("type") == "audio":
+                            payload = base64.b64decode(data["data"])
+                    if payload is not None:
+                        stats.bytes_received += len(payload)
+                        latency = latency_of(payload)
+                        if latency is not None:
+                            stats.downlink_latencies.append(latency)
+
+            receiver = asyncio.create_task(receive())
+            await send_audio()
+            receiver.cancel()
+    except Exception as e:
+        stats.failed += 1
+        if stats.failed <= 5:
+            print(f"client {i} failed: {e!r}")
+
+async def drive_clients(opts, conn):
+    stats = ClientStats()
+    stop = asyncio.Event()
+    tasks = []
+    ramp_delay = opts.ramp / max(1, opts.clients)
+    for i in range(opts.clients):
+        tasks.append(asyncio.create_task(run_client(i, opts, stats, stop)))
+        await asyncio.sleep(ramp_delay)
+    # Warm-up samples from the ramp are not part of the steady state
+    await asyncio.sleep(min(2.0, opts.duration / 4))
+    stats.downlink_latencies.clear()
+    conn.send("reset")
+    started = time.monotonic()
+    sent0, received0, messages0 = stats.bytes_sent, stats.bytes_received, stats.messages_received
+    await asyncio.sleep(opts.duration)
+    elapsed = time.monotonic() - started
+    messages = stats.messages_received - messages0
+    server = await asyncio.to_thread(lambda: (conn.send("measure"), conn.recv())[1])
+    stop.set()
+    await asyncio.gather(*tasks)
+    return stats, server, elapsed, stats.bytes_sent - sent0, stats.bytes_received - received0, messages
+
+def report(opts, stats, server, elapsed, sent, received, messages):
+    ms = lambda seconds: f"{seconds * 1000:8.1f} ms"
+    sessions = max(1, server["active_sessions"])
+    uplink = server["uplink_latencies"]
+    print(f"\nClients: {stats.connected} connected, {stats.failed} failed, "
+          f"{server['active_sessions']} sessions active at measurement ({opts.protocol} protocol)")
+    print(f"Steady-state window: {elapsed:.1f}s")
+    print("Relay latency          p50          p99          max      samples")
+    for name, values in (("uplink", uplink), ("downlink", stats.downlink_latencies)):
+        if values:
+            print(f"  {name:10s} {ms(percentile(values, 50))} {ms(percentile(values, 99))} {ms(max(values))} {len(values):10d}")
+    tools = server["tool_calls"]
+    if tools["round_trips"]:
+        round_trips = tools["round_trips"]
+        print(f"  {'tool call':10s} {ms(percentile(round_trips, 50))} {ms(percentile(round_trips, 99))} "
+              f"{ms(max(round_trips))} {len(round_trips):10d}   (call -> send_tool_response)")
+    if tools["made"]:
+        print(f"Tool calls: {tools['answered']} of {tools['made']} answered")
+    print(f"Throughput: {sent / elapsed / 1024:.1f} KiB/s client->server audio, "
+          f"{received / elapsed / 1024:.1f} KiB/s server->client audio, "
+          f"{messages / elapsed:.0f} msgs/s received")
+    cpu_pct = server["cpu_seconds"] / server["wall_seconds"] * 100
+    print(f"Server CPU: {cpu_pct:.1f}% of one core total, {cpu_pct / sessions:.3f}% per session")
+    if server["rss"] and server["baseline_rss"]:
+        growth = server["rss"] - server["baseline_rss"]
+        print(f"Server RSS: {server['rss'] / 2**20:.1f} MiB "
+              f"(+{growth / 2**20:.1f} MiB under load, {growth / sessions / 1024:.1f} KiB per session)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test LiveAPIWebSocketServer with a fake Gemini Live backend")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="steady-state seconds to measure")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which clients connect")
+    parser.add_argument("--protocol", choices=["json", "binary"], default="json")
+    parser.add_argument("--chunk-ms", type=float, default=40, help="audio chunk length in both directions")
+    parser.add_argument("--turn-seconds", type=float, default=3, help="client audio per user turn")
+    parser.add_argument("--reply-seconds", type=float, default=2, help="model audio per reply")
+    parser.add_argument("--tool-rate", type=float, default=0.2, help="fraction of replies preceded by a tool call")
+    parser.add_argument("--interrupt-rate", type=float, default=0.1, help="fraction of replies interrupted")
+    parser.add_argument("--connect-latency", type=float, default=0.2, help="fake Live handshake seconds")
+    parser.add_argument("--tool-latency", type=float, default=0.05, help="fake RAG seconds")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="fake db-server seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake text model seconds")
+    parser.add_argument("--real-rag", action="store_true", help="use the real embedding model and vector store")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve /metrics from the server under test")
+    opts = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    proc = ctx.Process(target=_server_main, args=(opts, child_conn), name="loadtest-server")
+    proc.start()
+    if not parent_conn.poll(60) or parent_conn.recv() != "ready":
+        proc.kill()
+        sys.exit("Server under test did not start")
+    try:
+        results = asyncio.run(drive_clients(opts, parent_conn))
+        report(opts, *results)
+    finally:
+        parent_conn.send("stop")
+        if parent_conn.poll(30):
+            parent_conn.recv()
+        proc.join(10)
+        if proc.is_alive():
+            proc.kill()
+
+if __name__ == "__main__":
+    main()
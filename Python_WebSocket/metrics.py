@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds (Prometheus client defaults)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_collectors = []  # called before each render to refresh metrics computed from live state
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, values, extra=None) -> str:
+    pairs = list(zip(labelnames, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Mirror a running total kept elsewhere (from a collector); it must never decrease."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        """Drop every label set, e.g. before re-publishing the current sessions."""
+        with self._lock:
+            self._values.clear()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return "\n".join(lines)
+
+def register_collector(callback):
+    """Run `callback()` before every render, to refresh gauges from live state."""
+    _collectors.append(callback)
+
+def publish_cache_stats(cache: str, stats: dict):
+    """Copy a cache's stats() counters onto the cache_* metrics under the given name."""
+    CACHE_HITS.set_total(stats["hits"], cache=cache)
+    CACHE_MISSES.set_total(stats["misses"], cache=cache)
+    CACHE_ENTRIES.set(stats["size"], cache=cache)
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    for callback in _collectors:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Metrics collector failed: {e}")
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+# ---------- Application metrics ----------
+ACTIVE_SESSIONS = Gauge("ws_active_sessions", "Connected WebSocket clients")
+AUDIO_FRAMES = Counter("ws_audio_frames_total", "Audio frames relayed (in: client to Gemini, out: Gemini to client)", ["direction"])
+AUDIO_BYTES = Counter("ws_audio_bytes_total", "PCM bytes relayed (in: client to Gemini, out: Gemini to client)", ["direction"])
+SESSION_AUDIO_QUEUE = Gauge(
+    "ws_session_audio_queue_seconds", "Client audio buffered for Gemini, per session", ["client_id"]
+)
+SESSION_AUDIO_LAG = Gauge(
+    "ws_session_audio_lag_seconds", "Receive-to-send lag of the last audio frame, per session", ["client_id"]
+)
+AUDIO_DROPPED_BYTES = Counter("ws_audio_dropped_bytes_total", "Client audio dropped by the overflow policy")
+TURN_LATENCY = Histogram("ws_turn_latency_seconds", "Last transcribed user input to first model audio of the reply")
+TOOL_LATENCY = Histogram("rag_tool_latency_seconds", "RAG tool call time by stage", ["stage"])
+SUMMARY_DURATION = Histogram(
+    "summary_duration_seconds", "End-of-session summary job time", ["outcome"],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+CACHE_HITS = Counter("cache_hits_total", "Lookups answered from the cache", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "Lookups the cache could not answer", ["cache"])
+CACHE_ENTRIES = Gauge("cache_entries", "Entries currently held", ["cache"])
+EMBED_MODEL_LOAD = Gauge("embedding_model_load_seconds", "Time to load the embedding model", ["backend"])
+EMBED_WARMUP = Gauge("embedding_warmup_seconds", "Throwaway encode run before serving", ["backend"])
+EMBED_BATCH_SIZE = Histogram(
+    "embedding_batch_size", "Queries encoded together by the embedding batcher",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+RAG_FIRST_RETRIEVAL = Gauge("rag_first_retrieval_seconds", "Latency of the first successful retrieval")
+RAG_TIME_TO_FIRST_RETRIEVAL = Gauge(
+    "rag_time_to_first_retrieval_seconds", "Process start to the first completed retrieval"
+)
+DB_LATENCY = Histogram("db_request_latency_seconds", "db-server request time including retries", ["route", "outcome"])
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Delay of a periodic timer past its deadline",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Measure how late the loop runs a timer; large values mean something is blocking it."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - start - interval))
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Drain headers; the request body (if any) is ignored
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+async def start_metrics_server(host: str, port: int):
+    """Serve GET /metrics on host:port. Returns the asyncio server."""
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,30 @@
+import struct
+
+# Wire protocols a client can negotiate in its initial user_id message
+PROTOCOL_JSON = "json"      # {"type": "audio", "data": <base64>} text frames (default)
+PROTOCOL_BINARY = "binary"  # raw PCM in binary frames, control messages stay JSON text
+
+# Binary frame layout: frame type (1 byte), reserved (1 byte), sequence number
+# (4 bytes, big-endian, wraps at 2**32), followed by the payload.
+FRAME_HEADER = struct.Struct("!BxI")
+
+FRAME_AUDIO = 0x01
+
+class ProtocolError(ValueError):
+    """Raised for binary frames that cannot be decoded."""
+
+def pack_frame(frame_type: int, seq: int, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(frame_type, seq & 0xFFFFFFFF) + payload
+
+def unpack_frame(frame: bytes):
+    """Returns (frame_type, seq, payload)."""
+    if len(frame) < FRAME_HEADER.size:
+        raise ProtocolError(f"Binary frame too short: {len(frame)} bytes")
+    frame_type, seq = FRAME_HEADER.unpack_from(frame)
+    return frame_type, seq, frame[FRAME_HEADER.size:]
+
+def negotiate(requested) -> str:
+    """Pick the protocol for a session from the client's request, falling back to JSON."""
+    if requested == PROTOCOL_BINARY:
+        return PROTOCOL_BINARY
+    return PROTOCOL_JSON
@@ -1,54 +1,185 @@
+import asyncio
 import logging
-from config import index
-from sentence_transformers import SentenceTransformer
+import time
+from config import (
+    VECTOR_NAMESPACE, RAG_CACHE_SIZE, RAG_CACHE_TTL, RAG_EMBEDDING_CACHE_SIZE, RAG_SEMANTIC_CACHE_THRESHOLD,
+)
+from embeddings import encode, aencode
+from cache import TTLLRUCache, SemanticCache, normalize_query
+from vector_store import get_vector_store
+from metrics import (
+    TOOL_LATENCY, RAG_FIRST_RETRIEVAL, RAG_TIME_TO_FIRST_RETRIEVAL, publish_cache_stats, register_collector,
+)
 
 logger = logging.getLogger(__name__)
 
+# Reference point for time-to-first-retrieval (module is imported at server startup)
+_started_at = time.monotonic()
+_first_retrieval_recorded = False
+
+def _record_first_retrieval(started: float):
+    """Publish how long the first lookup took, and how long after startup it completed."""
+    global _first_retrieval_recorded
+    if _first_retrieval_recorded:
+        return
+    _first_retrieval_recorded = True
+    now = time.monotonic()
+    RAG_FIRST_RETRIEVAL.set(now - started)
+    RAG_TIME_TO_FIRST_RETRIEVAL.set(now - _started_at)
+    logger.info(f"First retrieval took {now - started:.3f}s ({now - _started_at:.1f}s after startup)")
+
+# Formatted results and query embeddings, keyed on normalized query text
+_result_cache = TTLLRUCache(maxsize=RAG_CACHE_SIZE, ttl=RAG_CACHE_TTL)
+_embedding_cache = TTLLRUCache(maxsize=RAG_EMBEDDING_CACHE_SIZE, ttl=RAG_CACHE_TTL)
+_semantic_cache = (
+    SemanticCache(RAG_SEMANTIC_CACHE_THRESHOLD, maxsize=min(RAG_CACHE_SIZE, 256), ttl=RAG_CACHE_TTL)
+    if RAG_SEMANTIC_CACHE_THRESHOLD > 0 else None
+)
+
+def _publish_cache_stats():
+    """Hit/miss counters for the retrieval caches, refreshed on every /metrics scrape."""
+    publish_cache_stats("rag_results", _result_cache.stats())
+    publish_cache_stats("rag_embeddings", _embedding_cache.stats())
+    if _semantic_cache:
+        publish_cache_stats("rag_semantic", _semantic_cache.stats())
+
+register_collector(_publish_cache_stats)
+
+def _cache_result(key: str, query_embedding, result: str):
+    _result_cache.set(key, result)
+    if _semantic_cache:
+        _semantic_cache.add(key, query_embedding, result)
+
+# Define namespaces for medical resources
+NAMESPACES = [VECTOR_NAMESPACE]
+TOP_K_PER_NAMESPACE = 3  # Fewer per namespace to get diversity
+TOP_K = 5
+
+def _top_matches(all_results, top_k: int = TOP_K) -> list:
+    # Sort all results by score and take top 5
+    all_results.sort(key=lambda x: x['score'], reverse=True)
+    return all_results[:top_k]
+
+def _format_results(top_results) -> str:
+    # Format the results
+    resources = []
+    for match in top_results:
+        metadata = match['metadata']
+        source = match.get('source_namespace', 'Unknown')
+        resources.append(f"Source: {source}\nContent: {metadata.get('text', 'N/A')}\nPage: {metadata.get('page', 'N/A')}\nRelevance: {match['score']:.3f}")
+
+    return "\n\n".join(resources) if resources else "No relevant resources found."
+
+def _query_namespaces(query_embedding, top_k_per_namespace: int = TOP_K_PER_NAMESPACE):
+    """Query each namespace; returns (matches tagged with source_namespace, failed namespace count)."""
+    all_results = []
+    failed_namespaces = 0
+    for ns in NAMESPACES:
+        try:
+            matches = get_vector_store().query(query_embedding, top_k_per_namespace, ns)
+            # Add namespace info to results
+            for match in matches:
+                match['source_namespace'] = ns
+                all_results.append(match)
+        except Exception as ns_error:
+            logger.warning(f"Error querying namespace {ns}: {ns_error}")
+            failed_namespaces += 1
+    return all_results, failed_namespaces
+
+def search_resources(query_embedding, top_k: int = TOP_K) -> list:
+    """
+    Ranked matches ({"id", "score", "metadata", "source_namespace"}) for an
+    already-encoded query, bypassing the caches. Used by benchmark_retrieval.py
+    to score the same ranking the RAG tool formats.
+    """
+    all_results, _ = _query_namespaces(query_embedding, max(top_k, TOP_K_PER_NAMESPACE))
+    return _top_matches(all_results, top_k)
+
 def retrieve_mental_health_resources(query: str) -> str:
     """
-    Retrieve relevant mental health resources from Pinecone using RAG.
+    Retrieve relevant mental health resources from the vector store using RAG.
     Queries across multiple namespaces (one per PDF).
     """
+    started = time.monotonic()
+    key = normalize_query(query)
+    cached = _result_cache.get(key)
+    if cached is not None:
+        return cached
     try:
-        # Load the same embedding model used for upload
-        model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+        # Embed the query with the shared model (same one used for upload)
+        query_embedding = _embedding_cache.get(key)
+        if query_embedding is None:
+            with TOOL_LATENCY.time(stage="embed"):
+                query_embedding = encode(query).tolist()
+            _embedding_cache.set(key, query_embedding)
 
-        # Embed the query
-        query_embedding = model.encode(query).tolist()
+        if _semantic_cache:
+            cached = _semantic_cache.lookup(query_embedding)
+            if cached is not None:
+                _result_cache.set(key, cached)
+                return cached
 
-        # Define namespaces for medical resources
-        namespaces = ["medical-chatbot"]
+        with TOOL_LATENCY.time(stage="query"):
+            all_results, failed_namespaces = _query_namespaces(query_embedding)
 
-        # Query each namespace and collect results
-        all_results = []
-        for ns in namespaces:
-            try:
-                response = index.query(
-                    vector=query_embedding,
-                    top_k=3,  # Fewer per namespace to get diversity
-                    include_metadata=True,
-                    namespace=ns
-                )
-                # Add namespace info to results
-                for match in response['matches']:
-                    match['source_namespace'] = ns
-                    all_results.append(match)
-            except Exception as ns_error:
-                logger.warning(f"Error querying namespace {ns}: {ns_error}")
-                continue
+        result = _format_results(_top_matches(all_results))
+        # Don't cache partial answers from a namespace outage
+        if not failed_namespaces:
+            _cache_result(key, query_embedding, result)
+        _record_first_retrieval(started)
+        return result
+    except Exception as e:
+        logger.error(f"Error retrieving from vector store: {e}")
+        return "Error retrieving resources."
+
+async def aretrieve_mental_health_resources(query: str) -> str:
+    """
+    Async variant of retrieve_mental_health_resources for use inside the
+    WebSocket server: the encode runs on the embedding executor and the
+    namespaces are queried concurrently through the store's async API.
+    """
+    started = time.monotonic()
+    key = normalize_query(query)
+    cached = _result_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        query_embedding = _embedding_cache.get(key)
+        if query_embedding is None:
+            with TOOL_LATENCY.time(stage="embed"):
+                query_embedding = (await aencode(query)).tolist()
+            _embedding_cache.set(key, query_embedding)
 
-        # Sort all results by score and take top 5
-        all_results.sort(key=lambda x: x['score'], reverse=True)
-        top_results = all_results[:5]
+        if _semantic_cache:
+            cached = _semantic_cache.lookup(query_embedding)
+            if cached is not None:
+                _result_cache.set(key, cached)
+                return cached
 
-        # Format the results
-        resources = []
-        for match in top_results:
-            metadata = match['metadata']
-            source = match.get('source_namespace', 'Unknown')
-            resources.append(f"Source: {source}\nContent: {metadata.get('text', 'N/A')}\nPage: {metadata.get('page', 'N/A')}\nRelevance: {match['score']:.3f}")
+        store = get_vector_store()
+        with TOOL_LATENCY.time(stage="query"):
+            responses = await asyncio.gather(
+                *(store.aquery(query_embedding, TOP_K_PER_NAMESPACE, ns) for ns in NAMESPACES),
+                return_exceptions=True,
+            )
+
+        all_results = []
+        failed_namespaces = 0
+        for ns, response in zip(NAMESPACES, responses):
+            if isinstance(response, Exception):
+                logger.warning(f"Error querying namespace {ns}: {response}")
+                failed_namespaces += 1
+                continue
+            for match in response:
+                match['source_namespace'] = ns
+                all_results.append(match)
 
-        return "\n\n".join(resources) if resources else "No relevant resources found."
+        result = _format_results(_top_matches(all_results))
+        # Don't cache partial answers from a namespace outage
+        if not failed_namespaces:
+            _cache_result(key, query_embedding, result)
+        _record_first_retrieval(started)
+        return result
     except Exception as e:
-        logger.error(f"Error retrieving from Pinecone: {e}")
-        return "Error retrieving resources."
\ No newline at end of file
+        logger.error(f"Error retrieving from vector store: {e}")
+        return "Error retrieving resources."
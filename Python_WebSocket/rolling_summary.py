@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from config import get_client, MODEL, SUMMARY_CHUNK_TURNS, SUMMARY_CHUNK_CONCURRENCY
+from google.genai import types
+from session_state import read_transcript
+from utils import pick_summarizer_model
+
+logger = logging.getLogger(__name__)
+
+# Wait this long before retrying a chunk whose summarization failed
+CHUNK_RETRY_SECONDS = 30
+
+_chunk_semaphore = None
+
+# "my name is" followed by up to two words; punctuation or anything else ends the name
+_NAME_PATTERN = re.compile(r"\bmy name is\s+([^\W\d_][\w'-]*)(?:\s+([^\W\d_][\w'-]*))?", re.IGNORECASE)
+# Words that end a name when they follow its first word ("Sam and I ...")
+_NOT_A_NAME = {
+    "and", "but", "so", "or", "i", "im", "i'm", "from", "by", "the", "a", "an", "is", "was",
+    "here", "today", "now", "just", "actually", "also", "too", "again", "um", "uh", "like", "btw",
+}
+
+def chunks_path(transcript_path: str) -> str:
+    return transcript_path + ".chunks.jsonl"
+
+def find_user_name(turns) -> str:
+    """The name (one or two words) from the first 'my name is ...' the user said, or None."""
+    for turn in turns:
+        if turn.get("role") != "user":
+            continue
+        for match in _NAME_PATTERN.finditer(turn.get("text", "")):
+            first, second = match.group(1), match.group(2)
+            if first.lower() in _NOT_A_NAME:
+                continue
+            words = [first] if not second or second.lower() in _NOT_A_NAME else [first, second]
+            return " ".join(words).title()
+    return None
+
+def flatten_turns(turns) -> str:
+    return "\n".join(
+        f"{turn.get('role', 'user').upper()}: {turn.get('text', '').strip()}"
+        for turn in turns if turn.get("text", "").strip()
+    )
+
+def load_chunks(transcript_path: str, turn_count: int = None) -> list:
+    """
+    Chunk summaries of a transcript, in order, contiguous from turn 0 and
+    ending at or before `turn_count`. Each is {"start", "end", "summary", "user_name"}.
+    """
+    chunks = []
+    try:
+        with open(chunks_path(transcript_path), "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                if chunk["start"] != (chunks[-1]["end"] if chunks else 0):
+                    break
+                if turn_count is not None and chunk["end"] > turn_count:
+                    break
+                chunks.append(chunk)
+    except FileNotFoundError:
+        pass
+    return chunks
+
+async def summarize_chunk(turns) -> str:
+    """Condense part of a conversation into notes for the end-of-session summary."""
+    prompt = (
+        "Condense the following part of a health conversation into concise notes for a later clinical summary. "
+        "Keep every user-reported fact: symptoms with onset, duration and severity, medical history, medications, "
+        "physical observations, mood and stress, advice the assistant gave, and any mention of self-harm, "
+        "harming others, abuse or urgent symptoms. Do not add interpretation. Return plain text only."
+        "\n\n"
+        f"TRANSCRIPT:\n{flatten_turns(turns)}"
+    )
+    gen = await get_client().aio.models.generate_content(
+        model=pick_summarizer_model(MODEL),
+        contents=[prompt],
+        config=types.GenerateContentConfig(temperature=0.2),
+    )
+    text = ""
+    if gen and getattr(gen, "candidates", None):
+        for c in gen.candidates:
+            if getattr(c, "content", None) and getattr(c.content, "parts", None):
+                for p in c.content.parts:
+                    if getattr(p, "text", None):
+                        text += p.text
+    return text.strip()
+
+class RollingSummarizer:
+    """
+    Summarizes a session's transcript in chunks of `chunk_turns` completed turns
+    while the session is running, one chunk at a time. Chunk summaries are
+    appended to <transcript>.chunks.jsonl, so the end-of-session summary only
+    has to merge them with the few turns after the last chunk.
+    """
+
+    __slots__ = ("transcript_path", "chunk_turns", "covered", "_task", "_retry_at")
+
+    def __init__(self, transcript_path: str, chunk_turns: int = SUMMARY_CHUNK_TURNS):
+        self.transcript_path = transcript_path
+        self.chunk_turns = chunk_turns
+        self.covered = 0  # turns already condensed into chunks
+        self._task = None
+        self._retry_at = 0.0
+
+    def maybe_schedule(self, turn_count: int, spawn):
+        """Start condensing the next chunk if enough turns have completed. `spawn` runs a coroutine."""
+        if not self.transcript_path or self.chunk_turns <= 0:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        if turn_count - self.covered < self.chunk_turns or time.monotonic() < self._retry_at:
+            return
+        self._task = spawn(self._run(self.covered, self.covered + self.chunk_turns))
+
+    async def _run(self, start: int, end: int):
+        global _chunk_semaphore
+        if _chunk_semaphore is None:
+            _chunk_semaphore = asyncio.Semaphore(SUMMARY_CHUNK_CONCURRENCY)
+        try:
+            async with _chunk_semaphore:
+                turns = await asyncio.to_thread(read_transcript, self.transcript_path, end, start)
+                summary = await summarize_chunk(turns)
+            if not summary:
+                raise ValueError("empty chunk summary")
+            chunk = {"start": start, "end": end, "summary": summary, "user_name": find_user_name(turns)}
+            await asyncio.to_thread(self._append, chunk)
+            self.covered = end
+            logger.info(f"Condensed transcript turns {start}-{end} of {self.transcript_path}")
+        except Exception as e:
+            self._retry_at = time.monotonic() + CHUNK_RETRY_SECONDS
+            logger.error(f"Error condensing transcript turns {start}-{end}: {e}")
+
+    def _append(self, chunk: dict):
+        with open(chunks_path(self.transcript_path), "a", encoding="utf-8") as f:
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
@@ -1,9 +1,11 @@
+import argparse
 import asyncio
 import logging
+import signal
 import sys
 import os
 sys.path.insert(0, os.path.dirname(__file__))
-from websocket_server import LiveAPIWebSocketServer
+from config import EMBEDDING_PRELOAD, SERVER_WORKERS
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,13 +13,31 @@ logger = logging.getLogger(__name__)
 
 async def main():
     """Main function to start the server"""
+    from websocket_server import LiveAPIWebSocketServer
+    from embeddings import warm_up
+    if EMBEDDING_PRELOAD:
+        # Pay the model load before accepting clients, not on the first tool call
+        await asyncio.to_thread(warm_up)
     server = LiveAPIWebSocketServer()
+    try:
+        # Drain sessions and queued summaries on SIGTERM instead of dying mid-summary
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.request_stop)
+    except NotImplementedError:
+        pass  # Windows event loops have no signal handlers
     await server.start()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gemini Live WebSocket server")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS,
+                        help="worker processes sharing the port (default: SERVER_WORKERS)")
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        if args.workers > 1:
+            from supervisor import Supervisor
+            Supervisor(args.workers).run()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Exiting application via KeyboardInterrupt...")
     except Exception as e:
@@ -0,0 +1,152 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+# Compact role codes for transcript turns
+ROLE_USER = 0
+ROLE_ASSISTANT = 1
+ROLE_NAMES = ("user", "assistant")
+
+class TranscriptBuffer:
+    """
+    Transcript of one session, merged into turns as fragments arrive.
+    Consecutive fragments from the same role extend the open turn; a role change
+    or close_turn() completes it. Completed turns are appended to a JSONL file
+    ({"role", "text", "ts"} per line); only the open turn is kept in memory.
+    """
+
+    __slots__ = ("path", "turn_count", "_file", "_role", "_started", "_parts", "_wall_offset")
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.turn_count = 0  # completed turns, all of which are on disk
+        self._file = None
+        self._role = None
+        self._started = 0.0
+        self._parts = []
+        # Converts monotonic times to wall-clock times on export
+        self._wall_offset = time.time() - time.monotonic()
+
+    def append(self, role: int, text: str):
+        """Add a transcription fragment (or a whole message) from `role`."""
+        if self._role is not None and role != self._role:
+            self.close_turn()
+        if self._role is None:
+            self._role = role
+            self._started = time.monotonic()
+        self._parts.append(text)
+
+    def close_turn(self):
+        """Complete the open turn, if any. Returns (role name, text) or None."""
+        if self._role is None:
+            return None
+        role, started = self._role, self._started
+        # Transcription fragments carry their own spacing
+        text = "".join(self._parts).strip()
+        self._role = None
+        self._parts = []
+        if not text:
+            return None
+        self._write(role, started, text)
+        self.turn_count += 1
+        return ROLE_NAMES[role], text
+
+    def _write(self, role: int, started: float, text: str):
+        if self.path is None:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps({
+            "role": ROLE_NAMES[role],
+            "text": text,
+            "ts": datetime.fromtimestamp(started + self._wall_offset, timezone.utc).isoformat(),
+        }, ensure_ascii=False) + "\n")
+        # One small write per turn; flushed so a crash loses at most the open turn
+        self._file.flush()
+
+    def close(self):
+        self.close_turn()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return self.turn_count + (1 if self._parts else 0)
+
+def read_transcript(path: str, end: int = None, start: int = 0) -> list:
+    """Turns [start:end] (to the last turn if end is None) of a persisted session transcript."""
+    turns = []
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if end is not None and i >= end:
+                break
+            # Skipped turns are not parsed
+            if i >= start:
+                turns.append(json.loads(line))
+    return turns
+
+def count_turns(path: str) -> int:
+    """Number of turns in a persisted session transcript."""
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+def prune_transcripts(directory: str, max_age_seconds: float) -> int:
+    """Delete transcript files not written to in `max_age_seconds`. Returns how many were removed."""
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+class SessionState:
+    """Everything the server tracks for one connected client."""
+
+    __slots__ = (
+        "client_id", "websocket", "uid", "session_handle", "transcript",
+        "summarized_turns", "audio_pipeline", "timer", "rolling_summary",
+    )
+
+    def __init__(self, client_id, websocket, timer=None, transcript_path=None):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.uid = None
+        self.session_handle = None  # latest Live API resumption handle
+        self.transcript = TranscriptBuffer(transcript_path)
+        self.summarized_turns = 0  # transcript length covered by the last queued summary
+        self.audio_pipeline = None
+        self.timer = timer
+        self.rolling_summary = None  # RollingSummarizer, set by the server
+
+class SessionRegistry:
+    """Active sessions by client id; one dict entry per client, removed in O(1)."""
+
+    def __init__(self, transcript_dir: str = None):
+        self.transcript_dir = transcript_dir
+        self._sessions = {}
+
+    def add(self, client_id, websocket, timer=None) -> SessionState:
+        path = None
+        if self.transcript_dir:
+            path = os.path.join(self.transcript_dir, f"{time.time_ns()}-{client_id}.jsonl")
+        state = SessionState(client_id, websocket, timer, path)
+        self._sessions[client_id] = state
+        return state
+
+    def get(self, client_id):
+        return self._sessions.get(client_id)
+
+    def remove(self, client_id):
+        state = self._sessions.pop(client_id, None)
+        if state is not None:
+            state.transcript.close()
+        return state
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
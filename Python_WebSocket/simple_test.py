@@ -1,22 +1,19 @@
 import sys
 import os
 sys.path.insert(0, os.path.dirname(__file__))
-from config import client, rag_tool, index, MODEL
+from config import get_client, get_rag_tool, get_index, MODEL
 from google.genai import types
 import asyncio
-from sentence_transformers import SentenceTransformer
-
-# Load embedding model
-embedding_model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+from embeddings import encode
 
 def query_pinecone(query_text: str, top_k: int = 5):
     """Query Pinecone for relevant mental health resources."""
     try:
         # Generate embedding for the query
-        query_embedding = embedding_model.encode(query_text).tolist()
+        query_embedding = encode(query_text).tolist()
         
         # Query Pinecone
-        results = index.query(
+        results = get_index().query(
             vector=query_embedding,
             top_k=top_k,
             include_metadata=True
@@ -54,11 +51,11 @@ async def test_retrieval_and_reasoning():
         ]
         
         # First API call - model may request function call
-        response = await client.aio.models.generate_content(
+        response = await get_client().aio.models.generate_content(
             model=MODEL,
             contents=messages,
             config=types.GenerateContentConfig(
-                tools=[rag_tool],
+                tools=[get_rag_tool()],
                 temperature=0.7
             )
         )
@@ -105,11 +102,11 @@ async def test_retrieval_and_reasoning():
             print("Generating final answer with retrieved context...\n")
             print("-" * 70)
             
-            final_response = await client.aio.models.generate_content(
+            final_response = await get_client().aio.models.generate_content(
                 model=MODEL,
                 contents=messages,
                 config=types.GenerateContentConfig(
-                    tools=[rag_tool],
+                    tools=[get_rag_tool()],
                     temperature=0.7
                 )
             )
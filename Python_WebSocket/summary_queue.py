@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from config import SUMMARY_SPOOL_DIR, SUMMARY_WORKERS, SUMMARY_MAX_RETRIES
+from utils import ensure_dir
+
+logger = logging.getLogger(__name__)
+
+class SummaryJobQueue:
+    """
+    Durable queue of end-of-session summarization jobs.
+    Every job is spooled to disk as JSON before it is queued and removed only
+    after it succeeds, so pending summaries survive a restart. A fixed pool of
+    workers caps concurrent summarizer calls; failures are retried with backoff
+    and moved aside as *.failed once retries are exhausted.
+    """
+
+    def __init__(self, handler, spool_dir=SUMMARY_SPOOL_DIR, workers=SUMMARY_WORKERS,
+                 max_retries=SUMMARY_MAX_RETRIES):
+        # handler(job: dict) -> result; may update `job` and call save() to checkpoint progress
+        self.handler = handler
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.max_retries = max_retries
+        self._queue = asyncio.Queue()  # job ids; job bodies stay on disk
+        self._futures = {}
+        self._tasks = []
+        self._retries = {}  # job id -> timer handle of a job waiting out its backoff
+        self._retry_fired = asyncio.Event()
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+    def _write(self, job: dict):
+        path = self._path(job["job_id"])
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _read(self, job_id: str) -> dict:
+        with open(self._path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    async def save(self, job: dict):
+        """Persist changes a handler made to a job (e.g. an already generated summary)."""
+        await asyncio.to_thread(self._write, job)
+
+    async def start(self):
+        ensure_dir(self.spool_dir)
+        # Resume jobs left over from a previous run, oldest first
+        pending = sorted(
+            name[:-len(".json")] for name in os.listdir(self.spool_dir) if name.endswith(".json")
+        )
+        for job_id in pending:
+            self._queue.put_nowait(job_id)
+        if pending:
+            logger.info(f"Resuming {len(pending)} spooled summary jobs")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def submit(self, job: dict) -> asyncio.Future:
+        """Spool and enqueue a job. The returned future resolves with the handler's result."""
+        job = dict(job)
+        job["job_id"] = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        job.setdefault("attempts", 0)
+        await asyncio.to_thread(self._write, job)
+        future = asyncio.get_running_loop().create_future()
+        self._futures[job["job_id"]] = future
+        self._queue.put_nowait(job["job_id"])
+        return future
+
+    def _requeue(self, job_id: str):
+        self._retries.pop(job_id, None)
+        self._queue.put_nowait(job_id)
+        self._retry_fired.set()
+
+    def _cancel_retries(self):
+        # The jobs are already spooled with their attempt count; the next start() resumes them
+        for handle in self._retries.values():
+            handle.cancel()
+        self._retries.clear()
+
+    async def _worker(self, n: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Summary worker {n} failed on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await asyncio.to_thread(self._read, job_id)
+        future = self._futures.get(job_id)
+        try:
+            result = await self.handler(job)
+        except Exception as e:
+            job["attempts"] = job.get("attempts", 0) + 1
+            job["last_error"] = str(e)
+            if job["attempts"] > self.max_retries:
+                logger.error(f"Summary job {job_id} failed after {job['attempts']} attempts: {e}")
+                await asyncio.to_thread(self._write, job)
+                os.replace(self._path(job_id), self._path(job_id) + ".failed")
+                self._futures.pop(job_id, None)
+                if future and not future.done():
+                    future.set_exception(e)
+                return
+            delay = min(60, 2 ** job["attempts"])
+            logger.warning(f"Summary job {job_id} failed ({e}); retry {job['attempts']} in {delay}s")
+            await asyncio.to_thread(self._write, job)
+            # Re-enqueue later without holding a worker
+            self._retries[job_id] = asyncio.get_running_loop().call_later(delay, self._requeue, job_id)
+            return
+
+        await asyncio.to_thread(os.remove, self._path(job_id))
+        self._futures.pop(job_id, None)
+        if future and not future.done():
+            future.set_result(result)
+
+    async def _wait_idle(self):
+        """Return once no job is queued, running or waiting to retry."""
+        while True:
+            await self._queue.join()
+            if not self._retries:
+                return
+            self._retry_fired.clear()
+            await self._retry_fired.wait()
+
+    async def drain(self, timeout: float):
+        """
+        Wait up to `timeout` seconds for queued jobs, including ones waiting to
+        retry, to finish. Returns False on timeout.
+        """
+        try:
+            await asyncio.wait_for(self._wait_idle(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            waiting = len(self._retries)
+            self._cancel_retries()
+            logger.warning(
+                f"Summary queue not drained after {timeout}s ({waiting} jobs waiting to retry); "
+                f"remaining jobs stay spooled"
+            )
+            return False
+
+    async def stop(self):
+        """Stop workers; jobs still spooled on disk are picked up on the next start()."""
+        self._cancel_retries()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
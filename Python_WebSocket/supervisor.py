@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import socket
+import time
+from config import (
+    EMBEDDING_PRELOAD, WORKER_HEARTBEAT_INTERVAL, WORKER_HEARTBEAT_TIMEOUT, DRAIN_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Never restart a crashing worker faster than this (doubles per quick crash, capped)
+MAX_RESTART_DELAY = 30
+# A worker that ran at least this long is considered healthy again
+STABLE_AFTER_SECONDS = 60
+
+async def _heartbeat(value):
+    # Stops updating if the event loop is blocked, which is what the supervisor watches for
+    while True:
+        value.value = time.time()
+        await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+async def _serve(worker_id, host, port, heartbeat):
+    beat = asyncio.create_task(_heartbeat(heartbeat))
+    from websocket_server import LiveAPIWebSocketServer
+    from embeddings import warm_up
+    if EMBEDDING_PRELOAD:
+        await asyncio.to_thread(warm_up)
+    server = LiveAPIWebSocketServer(host, port, reuse_port=True, worker_id=worker_id)
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, server.request_stop)
+    loop.add_signal_handler(signal.SIGINT, server.request_stop)
+    try:
+        await server.start()
+    finally:
+        beat.cancel()
+    logger.info("Worker drained, exiting")
+
+def _worker_main(worker_id, host, port, heartbeat):
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - worker-{worker_id} - %(levelname)s - %(message)s",
+    )
+    asyncio.run(_serve(worker_id, host, port, heartbeat))
+
+class Supervisor:
+    """
+    Runs `workers` LiveAPIWebSocketServer processes listening on the same port
+    (SO_REUSEPORT; the kernel spreads new connections across them). Sessions are
+    shared-nothing: each worker owns its clients, spool and transcripts.
+    Dead workers, or workers whose event loop stops heartbeating, are restarted.
+    SIGTERM/SIGINT drain every worker, then exit.
+    """
+
+    def __init__(self, workers: int, host="0.0.0.0", port=8765):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("Multiple workers need SO_REUSEPORT (Linux/BSD); run with one worker instead")
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs = {}  # worker id -> (process, heartbeat value, started at)
+        self._crashes = {}  # worker id -> quick crashes in a row
+        self._restart_at = {}  # worker id -> monotonic time a crash-looping worker may restart
+        self._stopping = False
+
+    def _spawn(self, worker_id: int):
+        heartbeat = self._ctx.Value("d", time.time(), lock=False)
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.host, self.port, heartbeat),
+            name=f"ws-worker-{worker_id}",
+        )
+        proc.start()
+        self._procs[worker_id] = (proc, heartbeat, time.monotonic())
+        logger.info(f"Started worker {worker_id} (pid {proc.pid})")
+
+    def _restart(self, worker_id: int):
+        _, _, started = self._procs[worker_id]
+        if time.monotonic() - started < STABLE_AFTER_SECONDS:
+            self._crashes[worker_id] = self._crashes.get(worker_id, 0) + 1
+            delay = min(MAX_RESTART_DELAY, 2 ** self._crashes[worker_id])
+            logger.warning(f"Worker {worker_id} is crash-looping; restarting in {delay}s")
+            # _check() spawns it once the delay is up; the other workers stay monitored meanwhile
+            self._restart_at[worker_id] = time.monotonic() + delay
+            return
+        self._crashes[worker_id] = 0
+        self._spawn(worker_id)
+
+    def _check(self):
+        now = time.time()
+        for worker_id, (proc, heartbeat, _) in list(self._procs.items()):
+            restart_at = self._restart_at.get(worker_id)
+            if restart_at is not None:
+                if time.monotonic() >= restart_at:
+                    del self._restart_at[worker_id]
+                    self._spawn(worker_id)
+            elif not proc.is_alive():
+                logger.error(f"Worker {worker_id} exited with code {proc.exitcode}")
+                self._restart(worker_id)
+            elif now - heartbeat.value > WORKER_HEARTBEAT_TIMEOUT:
+                logger.error(f"Worker {worker_id} missed heartbeats for {now - heartbeat.value:.0f}s; killing it")
+                proc.kill()
+                proc.join()
+                self._restart(worker_id)
+
+    def _request_stop(self, signum, frame):
+        logger.info(f"Received signal {signum}; draining workers")
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        while not self._stopping:
+            time.sleep(WORKER_HEARTBEAT_INTERVAL)
+            if not self._stopping:
+                self._check()
+        self._shutdown()
+
+    def _shutdown(self):
+        for proc, _, _ in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()  # SIGTERM: the worker drains sessions and summaries
+        deadline = time.monotonic() + DRAIN_TIMEOUT + 10
+        for worker_id, (proc, _, _) in self._procs.items():
+            proc.join(max(0, deadline - time.monotonic()))
+            if proc.is_alive():
+                logger.error(f"Worker {worker_id} did not drain in time; killing it")
+                proc.kill()
+                proc.join()
+        logger.info("All workers stopped")
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+import time
+
+# Importing config must stay cheap and side-effect free (no network, no credentials)
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.0"))
+
+def measure_import(module: str) -> float:
+    """Wall time of `import <module>` in a fresh interpreter, minus bare interpreter startup."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=cwd, check=True)
+        return time.perf_counter() - start
+
+    baseline = run("pass")
+    return run(f"import {module}") - baseline
+
+def test_import_time():
+    """Fails if importing config exceeds the budget."""
+    elapsed = measure_import("config")
+    print(f"import config: {elapsed:.3f}s (budget {IMPORT_BUDGET_SECONDS:.1f}s)")
+    assert elapsed < IMPORT_BUDGET_SECONDS, f"import config took {elapsed:.3f}s"
+
+if __name__ == "__main__":
+    test_import_time()
@@ -0,0 +1,32 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+from rolling_summary import find_user_name
+
+def test_find_user_name_in_merged_turn():
+    """A merged turn keeps talking after the name; only the name is taken."""
+    turns = [
+        {"role": "assistant", "text": "Hi, what's your name?"},
+        {"role": "user", "text": "Hello my name is Sam and I feel anxious today because of work"},
+    ]
+    assert find_user_name(turns) == "Sam"
+
+def test_find_user_name_stops_at_punctuation():
+    turns = [{"role": "user", "text": "Yeah, my name is sam lee. I have not been sleeping well."}]
+    assert find_user_name(turns) == "Sam Lee"
+    turns = [{"role": "user", "text": "my name is Priya, and my head hurts"}]
+    assert find_user_name(turns) == "Priya"
+
+def test_find_user_name_only_from_user_turns():
+    turns = [
+        {"role": "assistant", "text": "My name is Gemini"},
+        {"role": "user", "text": "Nice to meet you, my name is Alex"},
+    ]
+    assert find_user_name(turns) == "Alex"
+    assert find_user_name([{"role": "user", "text": "I never said it"}]) is None
+
+if __name__ == "__main__":
+    test_find_user_name_in_merged_turn()
+    test_find_user_name_stops_at_punctuation()
+    test_find_user_name_only_from_user_turns()
+    print("ok")
@@ -1,23 +1,107 @@
+import argparse
+import hashlib
 import json
 import os
+import random
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
 sys.path.insert(0, os.path.dirname(__file__))
-from config import index
-from sentence_transformers import SentenceTransformer
+from config import VECTOR_NAMESPACE
+from embeddings import get_embedding_model
+from extract_data import vector_id
+from vector_store import get_vector_store
 from tqdm import tqdm
 
-def load_data(jsonl_file):
-    """Load the extracted data from JSONL file."""
-    data = []
+def iter_jsonl(jsonl_file):
+    """Yield records from a JSONL file one line at a time."""
     with open(jsonl_file, 'r', encoding='utf-8') as f:
         for line in f:
             if line.strip():
-                data.append(json.loads(line.strip()))
-    return data
+                yield json.loads(line.strip())
+
+def load_data(jsonl_file):
+    """Load the extracted data from JSONL file."""
+    return list(iter_jsonl(jsonl_file))
+
+def iter_json_array(json_file, chunk_size=1 << 16):
+    """
+    Yield the elements of a top-level JSON array one at a time.
+    Reads the file in chunks, so memory holds one chunk plus the current element.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_file, 'r', encoding='utf-8') as f:
+        buf, pos = f.read(chunk_size), 0
+
+        def next_char():
+            # Skip whitespace, refilling the buffer as needed; '' at EOF
+            nonlocal buf, pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return ''
+                buf, pos = chunk, 0
+
+        if next_char() != '[':
+            raise ValueError(f"{json_file} does not contain a JSON array")
+        pos += 1
+        if next_char() == ']':
+            return
+
+        while True:
+            next_char()
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                    # Only trust the element once its ',' or ']' is buffered too;
+                    # otherwise it may be cut at the chunk edge (e.g. "2" of "2.5")
+                    j = end
+                    while j < len(buf) and buf[j].isspace():
+                        j += 1
+                    complete = j < len(buf) and buf[j] in ',]'
+                except json.JSONDecodeError:
+                    complete = False
+                if complete:
+                    break
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise ValueError(f"Truncated or invalid JSON in {json_file}")
+                buf, pos = buf[pos:] + chunk, 0
+            yield item
+            pos = end
+
+            c = next_char()
+            if c == ',':
+                pos += 1
+            elif c == ']':
+                return
+            else:
+                raise ValueError(f"Unexpected {c!r} in JSON array in {json_file}")
+
+def iter_xml_qa_entries(xml_docs):
+    """Flatten extracted XML documents ({..., 'qa_pairs': [...]}) into Q&A dicts."""
+    for doc in xml_docs:
+        for qa in doc.get('qa_pairs', []):
+            yield {
+                'focus': doc.get('focus', ''),
+                'source': doc.get('source', ''),
+                'url': doc.get('url', ''),
+                'question': qa.get('question', ''),
+                'answer': qa.get('answer', ''),
+                'qtype': qa.get('qtype', ''),
+                'qid': qa.get('qid', ''),
+                'document_id': doc.get('document_id', ''),
+                'pid': qa.get('pid', '')
+            }
 
 def prepare_documents(data):
-    """Prepare documents for Pinecone upload."""
-    documents = []
+    """Prepare documents for upload. Lazily yields one document per usable Q&A record."""
     for qa in data:
         focus = qa.get('focus', '')
         source = qa.get('source', '')
@@ -46,86 +130,268 @@ def prepare_documents(data):
             'text': text
         }
 
-        documents.append({
-            'id': qid or f"{document_id}_{qa.get('pid', '')}",
+        yield {
+            'id': vector_id(qa),
             'text': text,
             'metadata': metadata
-        })
+        }
+
+def content_hash(doc) -> str:
+    """Fingerprint of what gets embedded and stored, used to skip unchanged documents."""
+    payload = json.dumps({'text': doc['text'], 'metadata': doc['metadata']}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+class IngestCheckpoint:
+    """
+    Append-only log (JSONL) of the content hash of every vector that is durably
+    in the store, per namespace; a null hash records a delete. A restarted (or
+    re-run) upload skips documents whose hash is already recorded, so it resumes
+    after the last saved batch and only embeds new or edited QA pairs.
+    Upserted ids are staged until the store has been flushed, so a crash can't
+    record vectors that were only buffered.
+    """
+
+    def __init__(self, path, namespace):
+        self.path = path
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self.hashes = {}  # id -> raw sha1 digest
+        self._staged = {}  # upserted, not yet known to be durable
+        self._unsaved = []  # (id, hex digest or None) not yet appended to the log
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get('namespace') != namespace:
+                        continue
+                    if entry['hash'] is None:
+                        self.hashes.pop(entry['id'], None)
+                    else:
+                        self.hashes[entry['id']] = bytes.fromhex(entry['hash'])
+
+    def is_current(self, doc_id, digest) -> bool:
+        return self.hashes.get(doc_id) == bytes.fromhex(digest)
+
+    def stage(self, id_hashes):
+        with self._lock:
+            self._staged.update(id_hashes)
+
+    def take_staged(self) -> dict:
+        with self._lock:
+            staged, self._staged = self._staged, {}
+        return staged
+
+    def mark_done(self, id_hashes):
+        with self._lock:
+            for doc_id, digest in id_hashes.items():
+                self.hashes[doc_id] = bytes.fromhex(digest)
+                self._unsaved.append((doc_id, digest))
 
-    return documents
+    def forget(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                self.hashes.pop(doc_id, None)
+                self._staged.pop(doc_id, None)
+                self._unsaved.append((doc_id, None))
 
-def upload_to_pinecone(documents, namespace="medical_resources", embed_batch_size=32):
-    """Upload documents to Pinecone with batched embedding."""
-    # Load the Hugging Face embedding model
-    model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+    def save(self):
+        with self._lock:
+            entries, self._unsaved = self._unsaved, []
+        if not self.path or not entries:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for doc_id, digest in entries:
+                f.write(json.dumps({'namespace': self.namespace, 'id': doc_id, 'hash': digest}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+def _batched(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+def _upsert_with_retry(store, vectors, namespace, max_retries):
+    for attempt in range(max_retries + 1):
+        try:
+            store.upsert(vectors, namespace)
+            return
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(30, 2 ** attempt) + random.uniform(0, 0.5)
+            print(f"Upsert of {len(vectors)} vectors failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def upload_to_pinecone(documents, namespace=VECTOR_NAMESPACE, embed_batch_size=256,
+                       upsert_batch_size=100, workers=4, checkpoint_path=None, max_retries=5):
+    """
+    Upload documents to the configured vector store.
+    The calling thread encodes large batches while `workers` threads upsert the
+    previous ones, so embedding and network I/O overlap. Completed upserts are
+    recorded in the checkpoint file, which makes the upload resumable.
+    """
+    # Shared Hugging Face embedding model
+    model = get_embedding_model()
+    store = get_vector_store()
+    checkpoint = IngestCheckpoint(checkpoint_path, namespace)
+
+    def pending_docs():
+        skipped = 0
+        for doc in documents:
+            digest = content_hash(doc)
+            if checkpoint.is_current(doc['id'], digest):
+                skipped += 1
+                continue
+            doc['hash'] = digest
+            yield doc
+        if skipped:
+            print(f"Skipped {skipped} unchanged documents already in namespace '{namespace}'")
+
+    def upsert_job(vectors, id_hashes):
+        _upsert_with_retry(store, vectors, namespace, max_retries)
+        checkpoint.stage(id_hashes)
+        return len(vectors)
+
+    def save_progress():
+        # Only what was upserted before this flush is durable; later upserts wait for the next save
+        durable = checkpoint.take_staged()
+        store.flush()
+        checkpoint.mark_done(durable)
+        checkpoint.save()
 
     total_uploaded = 0
-    for i in tqdm(range(0, len(documents), embed_batch_size), desc="Processing batches"):
-        batch_docs = documents[i:i+embed_batch_size]
-        texts = [doc['text'] for doc in batch_docs]
-
-        # Generate embeddings in batch
-        embeddings = model.encode(texts)
-
-        vectors = []
-        for j, doc in enumerate(batch_docs):
-            vectors.append({
-                'id': doc['id'],
-                'values': embeddings[j].tolist(),
-                'metadata': doc['metadata']
-            })
-
-        # Upsert the batch
-        index.upsert(vectors=vectors, namespace=namespace)
-        total_uploaded += len(vectors)
-        print(f"Uploaded batch {i//embed_batch_size + 1} with {len(vectors)} vectors")
+    failures = []
+    # Bounds the encoded-but-not-yet-upserted backlog held in memory
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    progress = tqdm(desc="Uploading", unit="doc")
+
+    def on_done(future):
+        nonlocal total_uploaded
+        in_flight.release()
+        try:
+            n = future.result()
+            total_uploaded += n
+            progress.update(n)
+        except Exception as e:
+            failures.append(e)
+            print(f"Upsert failed permanently: {e}")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upsert") as executor:
+        for batch_number, batch_docs in enumerate(_batched(pending_docs(), embed_batch_size), 1):
+            texts = [doc['text'] for doc in batch_docs]
+
+            # Generate embeddings in batch
+            embeddings = model.encode(texts)
 
+            for chunk_start in range(0, len(batch_docs), upsert_batch_size):
+                chunk = batch_docs[chunk_start:chunk_start + upsert_batch_size]
+                vectors = [
+                    {
+                        'id': doc['id'],
+                        'values': embeddings[chunk_start + j].tolist(),
+                        'metadata': doc['metadata']
+                    }
+                    for j, doc in enumerate(chunk)
+                ]
+                id_hashes = {doc['id']: doc['hash'] for doc in chunk}
+                in_flight.acquire()
+                executor.submit(upsert_job, vectors, id_hashes).add_done_callback(on_done)
+
+            # Persist progress every few batches so a crash loses little work
+            if batch_number % 10 == 0:
+                save_progress()
+
+    progress.close()
+    save_progress()
     print(f"Total uploaded: {total_uploaded} documents to namespace '{namespace}'")
+    if failures:
+        raise RuntimeError(f"{len(failures)} upsert batches failed; re-run to resume from the checkpoint")
+
+def apply_delta(delta_file, namespace=VECTOR_NAMESPACE, delete_batch_size=1000, checkpoint_path=None, **upload_kwargs):
+    """
+    Apply an extract_data.py delta (JSONL of {"op": "upsert"|"delete", "record": {...}})
+    to the vector store: deletes remove the records' vectors and their checkpoint
+    entries, then upserts go through the normal upload pipeline. A delete whose
+    vector is also upserted (an edited record) is dropped.
+    """
+    upserted_ids = {vector_id(op['record']) for op in iter_jsonl(delta_file) if op['op'] == 'upsert'}
+    deletes = (
+        vid for vid in (vector_id(op['record']) for op in iter_jsonl(delta_file) if op['op'] == 'delete')
+        if vid not in upserted_ids
+    )
+
+    store = get_vector_store()
+    checkpoint = IngestCheckpoint(checkpoint_path, namespace)
+    total_deleted = 0
+    for ids in _batched(deletes, delete_batch_size):
+        store.delete(ids, namespace)
+        checkpoint.forget(ids)
+        total_deleted += len(ids)
+    store.flush()
+    checkpoint.save()
+    print(f"Deleted {total_deleted} vectors from namespace '{namespace}'")
+
+    upserts = (op['record'] for op in iter_jsonl(delta_file) if op['op'] == 'upsert')
+    upload_to_pinecone(prepare_documents(upserts), namespace=namespace, checkpoint_path=checkpoint_path, **upload_kwargs)
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Embed QA documents and upload them to the vector store.")
+    ap.add_argument("--namespace", default=VECTOR_NAMESPACE, help="Target namespace (default: VECTOR_NAMESPACE)")
+    ap.add_argument("--embed-batch-size", type=int, default=256, help="Documents encoded per batch")
+    ap.add_argument("--upsert-batch-size", type=int, default=100, help="Vectors per upsert request")
+    ap.add_argument("--workers", type=int, default=4, help="Concurrent upsert workers")
+    ap.add_argument("--checkpoint", default=os.path.join(os.path.dirname(__file__), 'upload_checkpoint.jsonl'),
+                    help="Checkpoint file used to resume and to skip unchanged documents")
+    ap.add_argument("--no-checkpoint", action="store_true", help="Re-upload everything and don't record progress")
+    ap.add_argument("--delta", help="Apply only this delta JSONL from extract_data.py instead of the full corpus")
+    args = ap.parse_args()
+    checkpoint_path = None if args.no_checkpoint else args.checkpoint
+
+    if args.delta:
+        apply_delta(
+            args.delta,
+            namespace=args.namespace,
+            checkpoint_path=checkpoint_path,
+            embed_batch_size=args.embed_batch_size,
+            upsert_batch_size=args.upsert_batch_size,
+            workers=args.workers,
+        )
+        sys.exit(0)
+
+    # Chain the sources lazily; nothing is materialized before encoding
+    sources = []
+
     # Load from medical_qa.jsonl
     jsonl_file = os.path.join(os.path.dirname(__file__), 'medical_qa.jsonl')
-    data = []
     if os.path.exists(jsonl_file):
-        print("Loading data from medical_qa.jsonl...")
-        data.extend(load_data(jsonl_file))
+        print("Streaming data from medical_qa.jsonl...")
+        sources.append(iter_jsonl(jsonl_file))
     else:
         print(f"Data file {jsonl_file} not found.")
 
     # Load from all_medical_data.json (extracted XML data)
     json_file = os.path.join(os.path.dirname(__file__), 'all_medical_data.json')
     if os.path.exists(json_file):
-        print("Loading data from all_medical_data.json...")
-        xml_data = load_data(json_file)  # This will fail since load_data is now for JSONL
-        # Need to handle differently
-        with open(json_file, 'r', encoding='utf-8') as f:
-            xml_data = json.load(f)
-        # Convert XML data to list of Q&A dicts
-        for doc in xml_data:
-            for qa in doc.get('qa_pairs', []):
-                qa_entry = {
-                    'focus': doc.get('focus', ''),
-                    'source': doc.get('source', ''),
-                    'url': doc.get('url', ''),
-                    'question': qa.get('question', ''),
-                    'answer': qa.get('answer', ''),
-                    'qtype': qa.get('qtype', ''),
-                    'qid': qa.get('qid', ''),
-                    'document_id': doc.get('document_id', ''),
-                    'pid': qa.get('pid', '')
-                }
-                data.append(qa_entry)
+        print("Streaming data from all_medical_data.json...")
+        sources.append(iter_xml_qa_entries(iter_json_array(json_file)))
     else:
         print(f"Data file {json_file} not found. Run extract_data.py first.")
 
-    if not data:
+    if not sources:
         print("No data found to upload.")
         sys.exit(1)
 
-    print("Preparing documents...")
-    documents = prepare_documents(data)
-
-    print(f"Prepared {len(documents)} documents")
+    documents = prepare_documents(chain.from_iterable(sources))
 
-    print("Uploading to Pinecone...")
-    upload_to_pinecone(documents)
+    print("Uploading to vector store...")
+    upload_to_pinecone(
+        documents,
+        namespace=args.namespace,
+        embed_batch_size=args.embed_batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        workers=args.workers,
+        checkpoint_path=checkpoint_path,
+    )
@@ -1,5 +1,6 @@
 import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +77,22 @@ def validate_mood_scores(summary_obj: dict) -> dict:
     
     return summary_obj
 
+class StageTimer:
+    """Milliseconds from creation to named stages, e.g. the steps of a client connect."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.stages = {}
+
+    def mark(self, stage: str) -> float:
+        # First mark wins, so a stage can be marked from a hot loop
+        if stage not in self.stages:
+            self.stages[stage] = round((time.monotonic() - self.start) * 1000, 1)
+        return self.stages[stage]
+
+    def __contains__(self, stage: str) -> bool:
+        return stage in self.stages
+
 def ensure_dir(path: str):
     import os
     os.makedirs(path, exist_ok=True)
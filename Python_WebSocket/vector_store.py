@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import numpy as np
+from config import VECTOR_STORE_BACKEND, LOCAL_INDEX_DIR
+
+logger = logging.getLogger(__name__)
+
+class VectorStore:
+    """
+    Minimal interface shared by the retrieval path and the uploader.
+    Matches are plain dicts: {"id": ..., "score": ..., "metadata": {...}}.
+    """
+
+    def query(self, vector, top_k: int, namespace: str) -> list:
+        raise NotImplementedError
+
+    async def aquery(self, vector, top_k: int, namespace: str) -> list:
+        return await asyncio.to_thread(self.query, vector, top_k, namespace)
+
+    def upsert(self, vectors: list, namespace: str):
+        """vectors: [{"id": str, "values": list[float], "metadata": dict}, ...]"""
+        raise NotImplementedError
+
+    def delete(self, ids: list, namespace: str):
+        raise NotImplementedError
+
+    def flush(self):
+        """Make upserted vectors durable/visible. No-op for remote stores."""
+
+    async def close(self):
+        pass
+
+def _to_match(match) -> dict:
+    return {"id": match["id"], "score": match["score"], "metadata": match.get("metadata") or {}}
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, index_getter, async_index_getter=None, async_index_closer=None):
+        self._get_index = index_getter
+        self._get_async_index = async_index_getter
+        self._close_async_index = async_index_closer
+
+    def query(self, vector, top_k, namespace):
+        response = self._get_index().query(vector=vector, top_k=top_k, include_metadata=True, namespace=namespace)
+        return [_to_match(m) for m in response["matches"]]
+
+    async def aquery(self, vector, top_k, namespace):
+        if self._get_async_index is None:
+            return await super().aquery(vector, top_k, namespace)
+        async_index = await self._get_async_index()
+        response = await async_index.query(vector=vector, top_k=top_k, include_metadata=True, namespace=namespace)
+        return [_to_match(m) for m in response["matches"]]
+
+    def upsert(self, vectors, namespace):
+        self._get_index().upsert(vectors=vectors, namespace=namespace)
+
+    def delete(self, ids, namespace):
+        self._get_index().delete(ids=ids, namespace=namespace)
+
+    async def close(self):
+        if self._close_async_index is not None:
+            await self._close_async_index()
+
+# Buffered upserts are spilled to a float32 segment file once this many rows are waiting
+SPILL_ROWS = 4096
+
+class _LocalNamespace:
+    """
+    One namespace on disk: vectors.npy (unit-normalized float32) + metadata.jsonl (id, metadata per row).
+    Upserts are buffered as float32 rows and spilled to pending-<pid>-<n>.npy/.jsonl segments,
+    so an upload never holds more than SPILL_ROWS vectors in memory; flush() merges them in.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.matrix = None
+        self.ids = []
+        self.metadata = []
+        self.buffer = []  # (id, float32 vector, metadata) not yet spilled
+        self.segments = []  # (vectors path, metadata path) spilled since the last flush
+        self.latest = {}  # id -> (segment index, row) of its newest pending version
+        self.pending_deletes = set()
+        self._load()
+
+    def _load(self):
+        vectors_path = os.path.join(self.path, "vectors.npy")
+        meta_path = os.path.join(self.path, "metadata.jsonl")
+        if not os.path.exists(vectors_path):
+            return
+        # Memory-mapped: pages are shared between workers and loaded on demand
+        self.matrix = np.load(vectors_path, mmap_mode="r")
+        self.ids, self.metadata = [], []
+        with open(meta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                self.ids.append(row["id"])
+                self.metadata.append(row.get("metadata") or {})
+        logger.info(f"Loaded local vector namespace {self.path} with {len(self.ids)} vectors")
+
+    def query(self, vector, top_k):
+        if self.matrix is None or not len(self.ids):
+            return []
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+        scores = self.matrix @ q
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"id": self.ids[i], "score": float(scores[i]), "metadata": self.metadata[i]}
+            for i in top
+        ]
+
+    def upsert(self, vectors):
+        for v in vectors:
+            values = np.asarray(v["values"], dtype=np.float32)
+            norm = np.linalg.norm(values)
+            self.latest[v["id"]] = (len(self.segments), len(self.buffer))
+            self.buffer.append((v["id"], values / norm if norm else values, v.get("metadata") or {}))
+            self.pending_deletes.discard(v["id"])
+            if len(self.buffer) >= SPILL_ROWS:
+                self._spill()
+
+    def delete(self, ids):
+        for vid in ids:
+            self.latest.pop(vid, None)
+            self.pending_deletes.add(vid)
+
+    def _spill(self):
+        if not self.buffer:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        name = f"pending-{os.getpid()}-{len(self.segments)}"
+        vectors_path = os.path.join(self.path, name + ".npy")
+        meta_path = os.path.join(self.path, name + ".jsonl")
+        out = np.lib.format.open_memmap(
+            vectors_path, mode="w+", dtype=np.float32, shape=(len(self.buffer), len(self.buffer[0][1]))
+        )
+        with open(meta_path, "w", encoding="utf-8") as f:
+            for row, (vid, values, meta) in enumerate(self.buffer):
+                out[row] = values
+                f.write(json.dumps({"id": vid, "metadata": meta}, ensure_ascii=False) + "\n")
+        out.flush()
+        del out
+        self.segments.append((vectors_path, meta_path))
+        self.buffer = []
+
+    def _discard_segments(self):
+        for vectors_path, meta_path in self.segments:
+            os.remove(vectors_path)
+            os.remove(meta_path)
+        self.segments = []
+        self.latest = {}
+        self.pending_deletes = set()
+
+    def flush(self):
+        if not self.latest and not self.pending_deletes:
+            self.buffer = []
+            self._discard_segments()
+            return
+        self._spill()
+        if self.segments:
+            dim = np.load(self.segments[0][0], mmap_mode="r").shape[1]
+        elif self.matrix is not None:
+            dim = self.matrix.shape[1]
+        else:
+            # Deleting from an empty namespace
+            self._discard_segments()
+            return
+        old_rows = [
+            i for i, vid in enumerate(self.ids)
+            if vid not in self.latest and vid not in self.pending_deletes
+        ]
+        n_rows = len(old_rows) + len(self.latest)
+
+        # Write the merged matrix straight into a new memory-mapped file, SPILL_ROWS at a time
+        tmp_vectors = os.path.join(self.path, "vectors.npy.tmp")
+        out = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32, shape=(n_rows, dim))
+        ids, metadata = [], []
+        row = 0
+        for start in range(0, len(old_rows), SPILL_ROWS):
+            chunk = old_rows[start:start + SPILL_ROWS]
+            out[row:row + len(chunk)] = self.matrix[chunk]
+            ids.extend(self.ids[i] for i in chunk)
+            metadata.extend(self.metadata[i] for i in chunk)
+            row += len(chunk)
+        for index, (vectors_path, meta_path) in enumerate(self.segments):
+            segment = np.load(vectors_path, mmap_mode="r")
+            with open(meta_path, "r", encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f]
+            # Skip rows that were overwritten by a later upsert or deleted
+            rows = [r for r, entry in enumerate(entries) if self.latest.get(entry["id"]) == (index, r)]
+            out[row:row + len(rows)] = segment[rows]
+            ids.extend(entries[r]["id"] for r in rows)
+            metadata.extend(entries[r]["metadata"] for r in rows)
+            row += len(rows)
+            del segment
+        out.flush()
+        del out
+
+        tmp_meta = os.path.join(self.path, "metadata.jsonl.tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            for vid, meta in zip(ids, metadata):
+                f.write(json.dumps({"id": vid, "metadata": meta}, ensure_ascii=False) + "\n")
+
+        self.matrix = None
+        os.replace(tmp_vectors, os.path.join(self.path, "vectors.npy"))
+        os.replace(tmp_meta, os.path.join(self.path, "metadata.jsonl"))
+        self._discard_segments()
+        self._load()
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process exact cosine search over memory-mapped NumPy matrices,
+    one directory per namespace under `root`. No network, works offline.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace: str) -> _LocalNamespace:
+        ns = self._namespaces.get(namespace)
+        if ns is None:
+            with self._lock:
+                ns = self._namespaces.get(namespace)
+                if ns is None:
+                    ns = _LocalNamespace(os.path.join(self.root, namespace))
+                    self._namespaces[namespace] = ns
+        return ns
+
+    def query(self, vector, top_k, namespace):
+        return self._namespace(namespace).query(vector, top_k)
+
+    def upsert(self, vectors, namespace):
+        ns = self._namespace(namespace)
+        with self._lock:
+            ns.upsert(vectors)
+
+    def delete(self, ids, namespace):
+        ns = self._namespace(namespace)
+        with self._lock:
+            ns.delete(ids)
+
+    def flush(self):
+        with self._lock:
+            for ns in self._namespaces.values():
+                ns.flush()
+
+_store = None
+
+def get_vector_store() -> VectorStore:
+    """Process-wide store for the backend selected by VECTOR_STORE_BACKEND."""
+    global _store
+    if _store is None:
+        if VECTOR_STORE_BACKEND == "local":
+            _store = LocalVectorStore(LOCAL_INDEX_DIR)
+        elif VECTOR_STORE_BACKEND == "pinecone":
+            from config import get_index, get_async_index, close_async_index
+            _store = PineconeVectorStore(get_index, get_async_index, close_async_index)
+        else:
+            raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {VECTOR_STORE_BACKEND}")
+        logger.info(f"Using '{VECTOR_STORE_BACKEND}' vector store")
+    return _store
+
+async def close_vector_store():
+    if _store is not None:
+        await _store.close()
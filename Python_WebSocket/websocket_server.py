@@ -4,41 +4,102 @@ import base64
 import logging
 import websockets
 import traceback
-import requests
+import contextlib
+import os
+import time
 from datetime import datetime, timezone
 from websockets.exceptions import ConnectionClosed
-from config import client, MODEL, VOICE_NAME, SYSTEM_INSTRUCTION, rag_tool, SEND_SAMPLE_RATE
+from config import (
+    get_client, get_rag_tool, RAG_TOOL_NAME, MODEL, VOICE_NAME, SYSTEM_INSTRUCTION, SEND_SAMPLE_RATE, CONNECT_CONTEXT_MODE,
+    SESSION_HANDLE_CACHE_SIZE, SESSION_HANDLE_TTL, TRANSCRIPT_DIR, TRANSCRIPT_RETENTION_DAYS,
+    TRANSCRIPT_PRUNE_INTERVAL, SUMMARY_SPOOL_DIR, DRAIN_TIMEOUT, METRICS_HOST, METRICS_PORT,
+)
 from google.genai import types
-from utils import extract_json, validate_mood_scores, pick_summarizer_model
-from rag import retrieve_mental_health_resources
+from utils import extract_json, validate_mood_scores, pick_summarizer_model, StageTimer, ensure_dir
+from rag import aretrieve_mental_health_resources
+from cache import TTLLRUCache
+from session_state import SessionRegistry, ROLE_USER, ROLE_ASSISTANT, read_transcript, count_turns, prune_transcripts
+from rolling_summary import RollingSummarizer, load_chunks, chunks_path, find_user_name, flatten_turns
+from db_client import DBClient, DBClientError
+from vector_store import close_vector_store
+from audio_pipeline import AudioPipeline
+from summary_queue import SummaryJobQueue
+from followup_cache import FollowupQuestionCache, summary_version
+from metrics import (
+    ACTIVE_SESSIONS, SESSION_AUDIO_QUEUE, SESSION_AUDIO_LAG, AUDIO_FRAMES, AUDIO_BYTES, AUDIO_DROPPED_BYTES, TURN_LATENCY, TOOL_LATENCY,
+    SUMMARY_DURATION, register_collector, publish_cache_stats, start_metrics_server, monitor_event_loop_lag,
+)
+from protocol import PROTOCOL_BINARY, FRAME_AUDIO, ProtocolError, pack_frame, unpack_frame, negotiate
 
 logger = logging.getLogger(__name__)
 
+# How long a migration waits for sends on the old Gemini session before closing it
+MIGRATION_DRAIN_TIMEOUT = 5
+
 class LiveAPIWebSocketServer:
     """WebSocket server implementation using Gemini LiveAPI directly."""
 
-    def __init__(self, host="0.0.0.0", port=8765):
+    def __init__(self, host="0.0.0.0", port=8765, reuse_port=False, worker_id=None):
         self.host = host
         self.port = port
-        self.active_clients = {}
-        self.session_transcripts = {}
-        self.session_ids = {}
-        self.user_ids = {}
+        self.reuse_port = reuse_port
+        self.worker_id = worker_id
+        transcript_dir, spool_dir = TRANSCRIPT_DIR, SUMMARY_SPOOL_DIR
+        if worker_id is not None:
+            # Workers share nothing on disk they write to; a restarted worker resumes its own spool
+            transcript_dir = os.path.join(TRANSCRIPT_DIR, f"worker-{worker_id}")
+            spool_dir = os.path.join(SUMMARY_SPOOL_DIR, f"worker-{worker_id}")
+        self.sessions = SessionRegistry(transcript_dir)
+        # Resumption handles issued to this server's sessions; only their owner may resume them
+        self.resumption_handles = TTLLRUCache(maxsize=SESSION_HANDLE_CACHE_SIZE, ttl=SESSION_HANDLE_TTL)
+        self.db = DBClient()
+        self.summary_queue = SummaryJobQueue(self.summarize_and_store, spool_dir=spool_dir)
+        self.followup_cache = FollowupQuestionCache()
+        self._background_tasks = set()
+        self._stop_requested = asyncio.Event()
 
     async def start(self):
         logger.info(f"Starting WebSocket server on {self.host}:{self.port}")
-        async with websockets.serve(self.handle_client, self.host, self.port):
-            await asyncio.Future()
+        ensure_dir(self.sessions.transcript_dir)
+        pruner = asyncio.create_task(self.prune_transcripts_periodically())
+        await self.summary_queue.start()
+        metrics_server = None
+        if METRICS_PORT:
+            register_collector(self.publish_session_stats)
+            register_collector(lambda: publish_cache_stats("followup", self.followup_cache.stats()))
+            metrics_server = await start_metrics_server(METRICS_HOST, METRICS_PORT + (self.worker_id or 0))
+        lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+        try:
+            async with websockets.serve(self.handle_client, self.host, self.port, reuse_port=self.reuse_port) as ws_server:
+                await self._stop_requested.wait()
+                # Drain: stop accepting, close clients (1012 = service restart, so they reconnect
+                # elsewhere) and wait for their handlers, which queue the final summaries
+                logger.info(f"Draining {len(self.sessions)} sessions")
+                ws_server.close(code=1012)
+                await ws_server.wait_closed()
+            await self.summary_queue.drain(DRAIN_TIMEOUT)
+        finally:
+            lag_monitor.cancel()
+            pruner.cancel()
+            if metrics_server:
+                metrics_server.close()
+            await self.summary_queue.stop()
+            await self.db.close()
+            await close_vector_store()
 
     async def handle_client(self, websocket):
         """Handle a new WebSocket client connection"""
         client_id = id(websocket)
         logger.info(f"New client connected: {client_id}")
-
-        # Send ready message to client
-        await websocket.send(json.dumps({"type": "ready"}))
+        # Connect-path latency is measured from here to the first model audio
+        state = self.sessions.add(client_id, websocket, StageTimer())
+        state.rolling_summary = RollingSummarizer(state.transcript.path)
+        ACTIVE_SESSIONS.inc()
 
         try:
+            # Send ready message to client; it may already be gone, so the cleanup below must still run
+            await websocket.send(json.dumps({"type": "ready"}))
+
             # Start the audio processing for this client
             await self.process_audio(websocket, client_id)
         except ConnectionClosed:
@@ -47,81 +108,86 @@ class LiveAPIWebSocketServer:
             logger.error(f"Error handling client {client_id}: {e}")
             logger.error(traceback.format_exc())
         finally:
-            # Summarize and clean up on disconnect
+            # Queue a summary and clean up on disconnect; the connection is released immediately
             logger.info(f"Cleaning up connection for client {client_id}")
-            uid = self.user_ids.get(client_id)
-            if uid and self.session_transcripts.get(client_id):
-                logger.info(f"Connection closed for UID {uid}. Summarizing transcript.")
+            uid = state.uid
+            state.transcript.close_turn()
+            # Skip if an 'end' message already queued a summary covering every turn
+            if uid and len(state.transcript) > state.summarized_turns:
+                logger.info(f"Connection closed for UID {uid}. Queueing transcript summary.")
                 try:
-                    await self.summarize_and_store(client_id, uid)
+                    await self.enqueue_summary(client_id, uid)
                 except Exception as e:
-                    logger.error(f"Error during cleanup summarization for client {client_id}: {e}")
-
-            # Clean up dictionaries
-            if client_id in self.active_clients:
-                del self.active_clients[client_id]
-            if client_id in self.session_transcripts:
-                del self.session_transcripts[client_id]
-            if client_id in self.session_ids:
-                del self.session_ids[client_id]
-            if client_id in self.user_ids:
-                del self.user_ids[client_id]
-
-    async def generate_dynamic_system_instruction(self, uid: str) -> str:
+                    logger.error(f"Error queueing cleanup summarization for client {client_id}: {e}")
+
+            self.sessions.remove(client_id)
+            ACTIVE_SESSIONS.dec()
+            if "first_audio" not in state.timer:
+                logger.info(f"Connect timings for client {client_id} (no audio sent): {state.timer.stages}")
+            if state.audio_pipeline:
+                logger.info(f"Audio stats for client {client_id}: {state.audio_pipeline.stats()}")
+                AUDIO_DROPPED_BYTES.inc(state.audio_pipeline.dropped_bytes)
+
+    async def prune_transcripts_periodically(self):
+        """Delete transcripts whose summary never completed once they pass the retention period."""
+        while True:
+            try:
+                removed = await asyncio.to_thread(
+                    prune_transcripts, self.sessions.transcript_dir, TRANSCRIPT_RETENTION_DAYS * 86400
+                )
+                if removed:
+                    logger.info(f"Removed {removed} expired session transcripts")
+            except OSError as e:
+                logger.error(f"Error pruning session transcripts: {e}")
+            await asyncio.sleep(TRANSCRIPT_PRUNE_INTERVAL)
+
+    def request_stop(self):
+        """Begin a graceful shutdown; start() returns once sessions and summaries are drained."""
+        self._stop_requested.set()
+
+    def publish_session_stats(self):
+        """Refresh the per-session audio queue depth and lag gauges (runs on every /metrics scrape)."""
+        SESSION_AUDIO_QUEUE.clear()
+        SESSION_AUDIO_LAG.clear()
+        for state in self.sessions:
+            if state.audio_pipeline:
+                SESSION_AUDIO_QUEUE.set(state.audio_pipeline.depth_ms / 1000, client_id=state.client_id)
+                SESSION_AUDIO_LAG.set(state.audio_pipeline.last_lag_ms / 1000, client_id=state.client_id)
+
+    async def build_user_context(self, uid: str) -> str:
         """
-        Generates a dynamic system instruction based on user data from the database.
+        The per-user "Conversation Context" block (greeting and follow-up questions),
+        or '' when there is nothing to add to the base instruction.
         """
         if not uid:
             logger.warning("No UID provided, using default system instruction.")
-            return SYSTEM_INSTRUCTION
+            return ""
 
         try:
             # 1. Fetch user data from the Node.js server
-            response = requests.get(f"http://localhost:3000/user/{uid}")
-            if response.status_code != 200:
-                logger.error(f"Failed to fetch user data for UID {uid}. Status: {response.status_code}")
-                return SYSTEM_INSTRUCTION
+            user_data = await self.db.get_user(uid)
+            if not user_data:
+                return ""
 
-            user_data = response.json()
             user_name = user_data.get("name", "there")
-            latest_summary = user_data.get("latestSummary", {}).get("summary_data", {})
+            latest = user_data.get("latestSummary") or {}
+            latest_summary = latest.get("summary_data", {})
 
-            # 2. Generate questions using Gemini based on the summary
+            # 2. Look up follow-up questions precomputed when the summary was saved
             generated_questions = ""
             if latest_summary:
-                question_prompt = (
-                    "Based on the following summary of a user's previous session, "
-                    "generate 2-3 thoughtful, open-ended follow-up questions to help them continue exploring their feelings. "
-                    "The questions should be gentle, encouraging, and in line with the persona of a supportive mentor. "
-                    "Frame them as natural conversation starters.\n\n"
-                    f"PREVIOUS SUMMARY:\n{json.dumps(latest_summary, indent=2)}\n\n"
-                    "QUESTIONS:"
-                )
-                
-                try:
-                    question_model = pick_summarizer_model(MODEL)
-                    question_response = await client.aio.models.generate_content(
-                        model=question_model,
-                        contents=[question_prompt],
-                        config=types.GenerateContentConfig(temperature=0.7)
-                    )
-                    # Safely extract text from response
-                    if question_response and getattr(question_response, "candidates", None):
-                        for c in question_response.candidates:
-                            if getattr(c, "content", None) and getattr(c.content, "parts", None):
-                                for p in c.content.parts:
-                                    if getattr(p, "text", None):
-                                        generated_questions += p.text
-                    generated_questions = generated_questions.strip()
-                except Exception as e:
-                    logger.error(f"Error generating questions with Gemini: {e}")
+                version = summary_version(latest)
+                generated_questions = await self.followup_cache.get(uid, version)
+                if generated_questions is None:
+                    # Don't hold up the connection on an LLM call; fill the cache for next time
+                    logger.info(f"No cached follow-up questions for UID {uid}; generating in background")
+                    self._spawn(self.precompute_followup_questions(uid, latest))
                     generated_questions = "How have you been feeling since we last talked?" # Fallback question
 
             # 3. Construct the dynamic system instruction
             greeting = f"Start the conversation by warmly welcoming the user back. Greet them by name: '{user_name}'."
             
             dynamic_instruction = (
-                f"{SYSTEM_INSTRUCTION}\n\n"
                 f"--- Conversation Context ---\n"
                 f"{greeting}\n"
             )
@@ -140,47 +206,63 @@ class LiveAPIWebSocketServer:
             logger.info(f"Generated dynamic instruction for UID {uid}")
             return dynamic_instruction
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"RequestException when fetching user data: {e}")
-            return SYSTEM_INSTRUCTION
+        except DBClientError as e:
+            logger.error(f"DBClientError when fetching user data: {e}")
+            return ""
         except Exception as e:
-            logger.error(f"An unexpected error occurred in generate_dynamic_system_instruction: {e}")
+            logger.error(f"An unexpected error occurred in build_user_context: {e}")
             logger.error(traceback.format_exc())
-            return SYSTEM_INSTRUCTION
-
-    async def process_audio(self, websocket, client_id):
-        # Store reference to client
-        self.active_clients[client_id] = websocket
-
-        # Init transcript buffer for this client
-        self.session_transcripts[client_id] = []
+            return ""
+
+    def _spawn(self, coro):
+        """Run a fire-and-forget coroutine, keeping a reference until it finishes."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    async def generate_followup_questions(self, summary_data) -> str:
+        """Ask Gemini for follow-up questions based on a saved summary. Returns '' on failure."""
+        question_prompt = (
+            "Based on the following summary of a user's previous session, "
+            "generate 2-3 thoughtful, open-ended follow-up questions to help them continue exploring their feelings. "
+            "The questions should be gentle, encouraging, and in line with the persona of a supportive mentor. "
+            "Frame them as natural conversation starters.\n\n"
+            f"PREVIOUS SUMMARY:\n{json.dumps(summary_data, indent=2)}\n\n"
+            "QUESTIONS:"
+        )
 
-        # Wait for the initial user_id message before starting the session
-        uid = None
+        generated_questions = ""
         try:
-            message = await asyncio.wait_for(websocket.recv(), timeout=10.0)
-            data = json.loads(message)
-            if data.get("type") == "user_id":
-                uid = data.get("data")
-                self.user_ids[client_id] = uid
-                logger.info(f"Received user ID: {uid}")
-            else:
-                logger.error("First message from client was not 'user_id'. Closing connection.")
-                await websocket.close(code=1008, reason="user_id message expected")
-                return
-        except asyncio.TimeoutError:
-            logger.error("Client did not send user_id in time. Closing connection.")
-            await websocket.close(code=1008, reason="user_id timeout")
-            return
-        except (json.JSONDecodeError, websockets.exceptions.ConnectionClosed) as e:
-            logger.error(f"Error receiving user_id from client: {e}")
-            return # Connection is likely already closed or message was malformed
+            question_model = pick_summarizer_model(MODEL)
+            question_response = await get_client().aio.models.generate_content(
+                model=question_model,
+                contents=[question_prompt],
+                config=types.GenerateContentConfig(temperature=0.7)
+            )
+            # Safely extract text from response
+            if question_response and getattr(question_response, "candidates", None):
+                for c in question_response.candidates:
+                    if getattr(c, "content", None) and getattr(c.content, "parts", None):
+                        for p in c.content.parts:
+                            if getattr(p, "text", None):
+                                generated_questions += p.text
+        except Exception as e:
+            logger.error(f"Error generating questions with Gemini: {e}")
+        return generated_questions.strip()
 
-        # Generate dynamic system instruction using the received UID
-        dynamic_system_instruction = await self.generate_dynamic_system_instruction(uid)
+    async def precompute_followup_questions(self, uid: str, summary):
+        """Generate and cache follow-up questions for this version of the user's saved summary."""
+        version = summary_version(summary)
+        if await self.followup_cache.get(uid, version) is not None:
+            return
+        questions = await self.generate_followup_questions(summary.get("summary_data") or {})
+        if questions:
+            await self.followup_cache.put(uid, version, questions)
+            logger.info(f"Cached follow-up questions for UID {uid}")
 
-        # Create a new LiveAPI Config for this session with the dynamic instruction
-        live_config = types.LiveConnectConfig(
+    def _live_config(self, system_instruction: str, handle=None) -> types.LiveConnectConfig:
+        return types.LiveConnectConfig(
             response_modalities=["AUDIO"],
             output_audio_transcription={},
             input_audio_transcription={},
@@ -189,63 +271,254 @@ class LiveAPIWebSocketServer:
                     prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=VOICE_NAME)
                 )
             ),
-            session_resumption=types.SessionResumptionConfig(handle=None),
-            system_instruction=dynamic_system_instruction,
-            tools=[rag_tool],
+            session_resumption=types.SessionResumptionConfig(handle=handle),
+            system_instruction=system_instruction,
+            tools=[get_rag_tool()],
         )
 
-        # Connect to Gemini using LiveAPI with the session-specific config
-        async with client.aio.live.connect(model=MODEL, config=live_config) as session:
+    async def _open_live_session(self, system_instruction: str, timer: StageTimer, handle=None):
+        """
+        Connect to Gemini LiveAPI, resuming `handle` if given.
+        Returns (session, stack); the session stays open until stack.aclose().
+        """
+        stack = contextlib.AsyncExitStack()
+        try:
+            session = await stack.enter_async_context(
+                get_client().aio.live.connect(model=MODEL, config=self._live_config(system_instruction, handle))
+            )
+        except BaseException:
+            await stack.aclose()
+            raise
+        timer.mark("live_connected")
+        return session, stack
+
+    @staticmethod
+    async def _cancel_task(task):
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    @staticmethod
+    async def _discard_connect(task):
+        """Cancel a speculative connect, closing the session if it already opened."""
+        task.cancel()
+        results = await asyncio.gather(task, return_exceptions=True)
+        if isinstance(results[0], tuple):
+            await results[0][1].aclose()
+
+    async def process_audio(self, websocket, client_id):
+        state = self.sessions.get(client_id) or self.sessions.add(client_id, websocket, StageTimer())
+        timer = state.timer
+
+        async with contextlib.AsyncExitStack() as stack:
+            # Wait for the initial user_id message before starting the session
+            uid = None
+            resume_handle = None
+            try:
+                message = await asyncio.wait_for(websocket.recv(), timeout=10.0)
+                data = json.loads(message)
+                if data.get("type") == "user_id" and isinstance(data.get("data"), str) and data["data"].strip():
+                    uid = data.get("data")
+                    state.uid = uid
+                    logger.info(f"Received user ID: {uid}")
+                    # A reconnecting client may present the last session_id it was sent
+                    resume_handle = data.get("session_handle")
+                    # Clients may opt into binary audio frames alongside the user_id
+                    protocol = negotiate(data.get("protocol"))
+                    binary_mode = protocol == PROTOCOL_BINARY
+                    await websocket.send(json.dumps({"type": "protocol", "data": protocol}))
+                else:
+                    logger.error("First message from client was not a valid 'user_id'. Closing connection.")
+                    await websocket.close(code=1008, reason="user_id message expected")
+                    return
+            except asyncio.TimeoutError:
+                logger.error("Client did not send user_id in time. Closing connection.")
+                await websocket.close(code=1008, reason="user_id timeout")
+                return
+            except (json.JSONDecodeError, websockets.exceptions.ConnectionClosed) as e:
+                logger.error(f"Error receiving user_id from client: {e}")
+                return # Connection is likely already closed or message was malformed
+
+            timer.mark("user_id")
+
+            context_ready = asyncio.Event()
+            live = None
+            if resume_handle:
+                if self.resumption_handles.get(resume_handle) == uid:
+                    # The resumed Gemini session already has its instruction and context
+                    try:
+                        live = await self._open_live_session(SYSTEM_INSTRUCTION, timer, handle=resume_handle)
+                        state.session_handle = resume_handle
+                        logger.info(f"Resumed Gemini session for UID {uid}")
+                        context_ready.set()
+                    except Exception as e:
+                        logger.warning(f"Could not resume session for UID {uid}, starting a new one: {e}")
+                else:
+                    logger.warning(f"Ignoring unknown or expired session handle from client {client_id}")
+
+            if live is None:
+                connect_task = None
+                if CONNECT_CONTEXT_MODE == "refine":
+                    # The handshake doesn't depend on who the user is, so it overlaps the context fetch.
+                    # Only a validated user_id gets this far, so idle or bogus connections never open one.
+                    connect_task = asyncio.create_task(self._open_live_session(SYSTEM_INSTRUCTION, timer))
+                    stack.push_async_callback(self._discard_connect, connect_task)
+                # Fetch the user's data and build their context while the handshake finishes
+                context_task = asyncio.create_task(self.build_user_context(uid))
+                stack.push_async_callback(self._cancel_task, context_task)
+                if connect_task is None:
+                    context = await context_task
+                    timer.mark("context_ready")
+                    instruction = f"{SYSTEM_INSTRUCTION}\n\n{context}" if context else SYSTEM_INSTRUCTION
+                    live = await self._open_live_session(instruction, timer)
+                    context_ready.set()
+                else:
+                    live = await connect_task
+
+            session, live_stack = live
+
+            async def close_live():
+                # Reads live_stack at exit time, so a migrated session is the one closed
+                await live_stack.aclose()
+            stack.push_async_callback(close_live)
+
             async with asyncio.TaskGroup() as tg:
-                # Create a queue for audio data from the client
-                audio_queue = asyncio.Queue()
+                # Bounded, coalescing buffer for audio from the client
+                audio_pipeline = AudioPipeline()
+                state.audio_pipeline = audio_pipeline
+
+                # Sequence number for outgoing binary audio frames
+                out_seq = 0
+                # Pending summary_saved replies, dropped if the client leaves first
+                report_tasks = set()
+                # Turn latency: last transcribed/typed user input -> first audio of the model's reply
+                last_user_input_at = None
+                model_speaking = False
+                # Sends not yet finished, per Gemini session, so a migration can wait for them
+                sends_in_flight = {}  # session -> [count, idle event]
+
+                async def send_to_gemini(method: str, **kwargs):
+                    """Call a send method on the current session, tracked so migrate_session() can drain it."""
+                    target = session
+                    entry = sends_in_flight.setdefault(target, [0, asyncio.Event()])
+                    entry[0] += 1
+                    entry[1].clear()
+                    try:
+                        await getattr(target, method)(**kwargs)
+                    finally:
+                        entry[0] -= 1
+                        if not entry[0]:
+                            entry[1].set()
+                            if sends_in_flight.get(target) is entry:
+                                del sends_in_flight[target]
+
+                # Refine mode: the user's context follows the base instruction as the first turn.
+                # Audio and text wait for it so the model sees the context before the user speaks.
+                async def apply_context():
+                    try:
+                        context = await context_task
+                        timer.mark("context_ready")
+                        if context:
+                            await send_to_gemini(
+                                "send_client_content",
+                                turns=types.Content(role="user", parts=[types.Part(text=context)]),
+                                turn_complete=False,
+                            )
+                    except Exception as e:
+                        logger.error(f"Error sending user context to session: {e}")
+                    finally:
+                        context_ready.set()
+
+                # Task to tell the client when its queued summary has been saved
+                async def report_summary(future):
+                    try:
+                        saved_path = await future
+                        data = saved_path or "ok"
+                    except Exception as e:
+                        logger.error(f"Summarization error: {e}")
+                        data = f"error: {e}"
+                    try:
+                        await websocket.send(json.dumps({
+                            "type": "summary_saved",
+                            "data": data
+                        }))
+                    except Exception as se:
+                        logger.error(f"Error sending summary_saved over WS: {se}")
+
+                # Move to a fresh connection that resumes this session before the server drops it
+                async def migrate_session() -> bool:
+                    nonlocal session, live_stack
+                    handle = state.session_handle
+                    if not handle:
+                        logger.warning(f"GoAway for client {client_id} but no resumption handle yet")
+                        return False
+                    try:
+                        new_session, new_stack = await self._open_live_session(SYSTEM_INSTRUCTION, timer, handle=handle)
+                    except Exception as e:
+                        logger.error(f"Error migrating session for client {client_id}: {e}")
+                        return False
+                    old_session, old_stack = session, live_stack
+                    # Senders pick up the new session on their next call
+                    session, live_stack = new_session, new_stack
+                    # Let sends already started on the old session finish before closing it
+                    entry = sends_in_flight.get(old_session)
+                    if entry:
+                        try:
+                            await asyncio.wait_for(entry[1].wait(), timeout=MIGRATION_DRAIN_TIMEOUT)
+                        except asyncio.TimeoutError:
+                            logger.warning(f"Closing old Gemini session for client {client_id} with sends in flight")
+                    await old_stack.aclose()
+                    logger.info(f"🔁 Migrated client {client_id} to a resumed Gemini session")
+                    return True
 
                 # Task to process incoming WebSocket messages (audio, text, end)
                 async def handle_websocket_messages():
+                    nonlocal last_user_input_at
                     async for message in websocket:
+                        # Binary frames carry raw PCM; skip JSON and base64 entirely
+                        if isinstance(message, bytes):
+                            try:
+                                frame_type, _seq, payload = unpack_frame(message)
+                                if binary_mode and frame_type == FRAME_AUDIO:
+                                    await audio_pipeline.put(payload)
+                                else:
+                                    logger.warning(f"Ignoring binary frame of type {frame_type} for client {client_id}")
+                            except ProtocolError as e:
+                                logger.error(f"Invalid binary frame: {e}")
+                            continue
+
                         try:
                             data = json.loads(message)
                             if data.get("type") == "audio":
                                 audio_bytes = base64.b64decode(data.get("data", ""))
-                                await audio_queue.put(audio_bytes)
+                                await audio_pipeline.put(audio_bytes)
                             elif data.get("type") == "end":
                                 logger.info("Received end signal from client")
                                 # Summarize on demand when client signals end
-                                try:
-                                    uid = self.user_ids.get(client_id)
-                                    if not uid:
-                                        logger.error("No user ID found for client")
-                                        continue
-
-                                    saved_path = await self.summarize_and_store(client_id, uid)
-                                    try:
-                                        await websocket.send(json.dumps({
-                                            "type": "summary_saved",
-                                            "data": saved_path or "ok"
-                                        }))
-                                    except Exception as se:
-                                        logger.error(f"Error sending summary_saved over WS: {se}")
-                                except Exception as e:
-                                    logger.error(f"Summarization error: {e}")
-                                    try:
-                                        await websocket.send(json.dumps({
-                                            "type": "summary_saved",
-                                            "data": f"error: {e}"
-                                        }))
-                                    except Exception as se:
-                                        logger.error(f"Error sending error over WS: {se}")
+                                uid = state.uid
+                                if not uid:
+                                    logger.error("No user ID found for client")
+                                    continue
+                                if not state.transcript:
+                                    logger.info("No transcript found; skipping summary.")
+                                    continue
+                                future = await self.enqueue_summary(client_id, uid)
+                                # Reply when the background job finishes; keep reading messages meanwhile
+                                report = tg.create_task(report_summary(future))
+                                report_tasks.add(report)
+                                report.add_done_callback(report_tasks.discard)
                             elif data.get("type") == "text":
                                 txt = data.get("data")
                                 logger.info(f"Received text: {txt}")
                                 # Record explicit text messages from client as user turns
                                 if txt:
-                                    self.session_transcripts[client_id].append({
-                                        "role": "user",
-                                        "text": txt,
-                                        "ts": datetime.now(timezone.utc).isoformat()
-                                    })
+                                    # A typed message is a turn of its own
+                                    state.transcript.close_turn()
+                                    state.transcript.append(ROLE_USER, txt)
+                                    state.transcript.close_turn()
                                     # Corrected method to send text content
-                                    await session.send_realtime_input(text=txt)
+                                    await context_ready.wait()
+                                    await send_to_gemini("send_realtime_input", text=txt)
+                                    last_user_input_at = time.perf_counter()
                             elif data.get("type") == "user_id":
                                 # This shouldn't happen if client logic is correct, but log it.
                                 logger.warning(f"Received subsequent user_id message for client {client_id}.")
@@ -254,32 +527,68 @@ class LiveAPIWebSocketServer:
                         except Exception as e:
                             logger.error(f"Error processing message: {e}")
 
+                    # The client is gone: stop relaying so the session ends and its summary is queued
+                    sender.cancel()
+                    receiver.cancel()
+                    for task in report_tasks:
+                        task.cancel()
+
                 # Task to process and send audio to Gemini
                 async def process_and_send_audio():
+                    await context_ready.wait()
                     while True:
-                        data = await audio_queue.get()
-                        await session.send_realtime_input(
+                        data, received_at = await audio_pipeline.get_frame()
+                        await send_to_gemini(
+                            "send_realtime_input",
                             media={
                                 "data": data,
                                 "mime_type": f"audio/pcm;rate={SEND_SAMPLE_RATE}",
                             }
                         )
-                        audio_queue.task_done()
+                        audio_pipeline.record_sent(received_at)
+                        AUDIO_FRAMES.inc(direction="in")
+                        AUDIO_BYTES.inc(len(data), direction="in")
+
+                # Task to answer a single RAG tool call without blocking the receive loop
+                async def run_tool_call(call):
+                    try:
+                        query = call.args.get("query", "")
+                        with TOOL_LATENCY.time(stage="total"):
+                            result = await aretrieve_mental_health_resources(query)
+                        # Send the tool result back to the session
+                        await send_to_gemini(
+                            "send_tool_response",
+                            function_responses=[
+                                types.FunctionResponse(id=call.id, name=call.name, response={"result": result})
+                            ],
+                        )
+                    except Exception as e:
+                        logger.error(f"Error handling tool call: {e}")
+
+                # Task to persist suggested exercises without blocking the receive loop
+                async def save_exercises(uid, exercise_ids):
+                    try:
+                        body = await self.db.save_exercises(uid, exercise_ids)
+                        logger.info(f"Save exercises response body: {body}")
+                    except DBClientError as e:
+                        logger.error(f"HTTP Request error when saving exercises: {e}")
 
                 # Task to receive and play responses
                 async def receive_and_play():
+                    nonlocal out_seq, last_user_input_at, model_speaking
                     while True:
-                        input_transcriptions = []
-                        output_transcriptions = []
-
                         async for response in session.receive():
                             if response.session_resumption_update:
                                 update = response.session_resumption_update
                                 if update.resumable and update.new_handle:
                                     session_id = update.new_handle
                                     logger.info(f"New SESSION: {session_id}")
-                                    # Keep latest handle per client
-                                    self.session_ids[client_id] = session_id
+                                    # Keep latest handle per client; only the newest one is resumable
+                                    if state.session_handle:
+                                        self.resumption_handles.pop(state.session_handle)
+                                    state.session_handle = session_id
+                                    if state.uid:
+                                        self.resumption_handles.set(session_id, state.uid)
 
                                     session_id_msg = json.dumps({
                                         "type": "session_id", "data": session_id
@@ -291,11 +600,16 @@ class LiveAPIWebSocketServer:
 
                             if response.go_away is not None:
                                 logger.info(f"Session will terminate in: {response.go_away.time_left}")
+                                if await migrate_session():
+                                    # Continue on the new session's receive stream
+                                    break
 
                             server_content = response.server_content
 
                             if (hasattr(server_content, "interrupted") and server_content.interrupted):
                                 logger.info("🤐 INTERRUPTION DETECTED")
+                                state.transcript.close_turn()
+                                model_speaking = False
                                 try:
                                     await websocket.send(json.dumps({
                                         "type": "interrupted",
@@ -307,46 +621,55 @@ class LiveAPIWebSocketServer:
                             if server_content and server_content.model_turn:
                                 for part in server_content.model_turn.parts:
                                     if part.inline_data:
-                                        b64_audio = base64.b64encode(part.inline_data.data).decode('utf-8')
+                                        if "first_audio" not in timer:
+                                            timer.mark("first_audio")
+                                            logger.info(f"⏱️ Connect timings for client {client_id}: {timer.stages}")
+                                        if not model_speaking:
+                                            model_speaking = True
+                                            if last_user_input_at is not None:
+                                                TURN_LATENCY.observe(time.perf_counter() - last_user_input_at)
+                                                last_user_input_at = None
+                                        AUDIO_FRAMES.inc(direction="out")
+                                        AUDIO_BYTES.inc(len(part.inline_data.data), direction="out")
                                         try:
-                                            await websocket.send(json.dumps({
-                                                "type": "audio", "data": b64_audio
-                                            }))
+                                            if binary_mode:
+                                                await websocket.send(pack_frame(FRAME_AUDIO, out_seq, part.inline_data.data))
+                                                out_seq += 1
+                                            else:
+                                                b64_audio = base64.b64encode(part.inline_data.data).decode('utf-8')
+                                                await websocket.send(json.dumps({
+                                                    "type": "audio", "data": b64_audio
+                                                }))
                                         except Exception as se:
                                             logger.error(f"Error sending audio over WS: {se}")
 
                             if server_content and server_content.turn_complete:
                                 logger.info("✅ Gemini done talking")
+                                model_speaking = False
+                                turn = state.transcript.close_turn()
+                                if turn:
+                                    logger.info(f"Output transcription: {turn[1]}")
+                                # Condense older turns in the background while the session runs
+                                state.rolling_summary.maybe_schedule(state.transcript.turn_count, self._spawn)
                                 try:
                                     await websocket.send(json.dumps({ "type": "turn_complete" }))
                                 except Exception as se:
                                     logger.error(f"Error sending turn_complete over WS: {se}")
 
-                            # Handle tool calls
-                            if server_content and hasattr(server_content, 'tool_call') and server_content.tool_call:
-                                tool_call = server_content.tool_call
+                            # Handle tool calls (their own message, not part of server_content)
+                            tool_call = getattr(response, "tool_call", None)
+                            if tool_call and tool_call.function_calls:
                                 logger.info(f"Tool call received: {tool_call}")
-                                try:
-                                    if tool_call.function_calls:
-                                        for call in tool_call.function_calls:
-                                            if call.name == "retrieve_mental_health_resources":
-                                                query = call.args.get("query", "")
-                                                result = retrieve_mental_health_resources(query)
-                                                # Send the tool result back to the session
-                                                await session.send_realtime_input(
-                                                    tool_result={
-                                                        "name": call.name,
-                                                        "call_id": call.call_id,
-                                                        "result": result
-                                                    }
-                                                )
-                                except Exception as e:
-                                    logger.error(f"Error handling tool call: {e}")
+                                for call in tool_call.function_calls:
+                                    if call.name == RAG_TOOL_NAME:
+                                        # Run in its own task so this session keeps relaying audio meanwhile
+                                        tg.create_task(run_tool_call(call))
+                                    else:
+                                        logger.warning(f"Ignoring call to unknown tool {call.name}")
 
                             output_transcription = getattr(response.server_content, "output_transcription", None)
                             if output_transcription and output_transcription.text:
                                 text_out = output_transcription.text
-                                output_transcriptions.append(text_out)
 
                                 # Check for and save suggested exercises
                                 try:
@@ -357,17 +680,11 @@ class LiveAPIWebSocketServer:
                                             json_str = text_out[start:end]
                                             data = json.loads(json_str)
                                             exercise_ids = data.get("suggested_exercises")
-                                            uid = self.user_ids.get(client_id)
+                                            uid = state.uid
                                             if uid and exercise_ids and isinstance(exercise_ids, list):
                                                 logger.info(f"Found suggested exercises: {exercise_ids} for user {uid}. Sending to db-server...")
-                                                payload = {"uid": uid, "exerciseIds": exercise_ids}
-                                                try:
-                                                    # This is a blocking call, consider using an async library like aiohttp in production
-                                                    response = requests.post("http://localhost:3000/save-exercises", json=payload)
-                                                    logger.info(f"Save exercises response status: {response.status_code}")
-                                                    logger.info(f"Save exercises response body: {response.text}")
-                                                except requests.exceptions.RequestException as req_e:
-                                                    logger.error(f"HTTP Request error when saving exercises: {req_e}")
+                                                # Fire-and-forget so the receive loop keeps relaying audio
+                                                tg.create_task(save_exercises(uid, exercise_ids))
                                 except Exception as e:
                                     logger.error(f"Error processing suggested exercises: {e}")
 
@@ -378,72 +695,127 @@ class LiveAPIWebSocketServer:
                                 except Exception as se:
                                     logger.error(f"Error sending text over WS: {se}")
                                 # Record assistant outputs
-                                self.session_transcripts[client_id].append({
-                                    "role": "assistant",
-                                    "text": text_out,
-                                    "ts": datetime.now(timezone.utc).isoformat()
-                                })
+                                state.transcript.append(ROLE_ASSISTANT, text_out)
 
                             input_transcription = getattr(response.server_content, "input_transcription", None)
                             if input_transcription and input_transcription.text:
                                 text_in = input_transcription.text
-                                input_transcriptions.append(text_in)
                                 # Record user recognized speech
-                                self.session_transcripts[client_id].append({
-                                    "role": "user",
-                                    "text": text_in,
-                                    "ts": datetime.now(timezone.utc).isoformat()
-                                })
-
-                        logger.info(f"Output transcription: {''.join(output_transcriptions)}")
-                        logger.info(f"Input transcription: {''.join(input_transcriptions)}")
+                                state.transcript.append(ROLE_USER, text_in)
+                                if not model_speaking:
+                                    last_user_input_at = time.perf_counter()
 
                 # Start all tasks
+                if not context_ready.is_set():
+                    tg.create_task(apply_context())
                 tg.create_task(handle_websocket_messages())
-                tg.create_task(process_and_send_audio())
-                tg.create_task(receive_and_play())
+                sender = tg.create_task(process_and_send_audio())
+                receiver = tg.create_task(receive_and_play())
 
     # ---------- Summarize & store function ----------
-    async def summarize_and_store(self, client_id: str, uid: str):
+    async def enqueue_summary(self, client_id, uid: str) -> asyncio.Future:
+        """Queue a durable summary job covering every turn of the session so far."""
+        state = self.sessions.get(client_id)
+        state.transcript.close_turn()
+        state.summarized_turns = state.transcript.turn_count
+        # The job references the on-disk transcript instead of copying it
+        return await self.summary_queue.submit({
+            "uid": uid,
+            "client_id": client_id,
+            "session_id": state.session_handle,
+            "transcript_path": state.transcript.path,
+            "turn_count": state.transcript.turn_count,
+        })
+
+    async def summarize_and_store(self, job: dict):
+        """Summary job handler; times _summarize_and_store for the metrics endpoint."""
+        started = time.perf_counter()
+        try:
+            result = await self._summarize_and_store(job)
+        except Exception:
+            SUMMARY_DURATION.observe(time.perf_counter() - started, outcome="error")
+            raise
+        SUMMARY_DURATION.observe(time.perf_counter() - started, outcome="ok")
+        await self.delete_summarized_transcript(job)
+        return result
+
+    async def delete_summarized_transcript(self, job: dict):
+        """
+        Delete a session's transcript and chunk notes once a summary covering all of it is stored.
+        A session that is still connected, or whose later job covers more turns, keeps its files.
+        """
+        path = job.get("transcript_path")
+        if not path or any(state.transcript.path == path for state in self.sessions):
+            return
+        try:
+            if await asyncio.to_thread(count_turns, path) > job.get("turn_count", 0):
+                return
+            for name in (path, chunks_path(path)):
+                with contextlib.suppress(FileNotFoundError):
+                    await asyncio.to_thread(os.remove, name)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error deleting transcript {path}: {e}")
+
+    async def _summarize_and_store(self, job: dict):
         """
-        Summarizes the full transcript with a focus on clinical, user-reported health data
-        and sends it to the Node.js backend.
+        Summary job handler: summarizes the full transcript with a focus on clinical,
+        user-reported health data and sends it to the Node.js backend.
+        Parts of the session already condensed by the RollingSummarizer are merged
+        from their chunk summaries; only the remaining turns are sent verbatim.
+        Raises on failure so the job queue retries it.
         """
-        transcript = self.session_transcripts.get(client_id, [])
-        if not transcript:
+        uid = job["uid"]
+        client_id = job.get("client_id")
+
+        # A retry after a failed save reuses the summary instead of regenerating it
+        if job.get("summary_payload"):
+            body = await self.db.save_summary(job["summary_payload"])
+            logger.info(f"✅ Summary sent to Node.js backend: {body}")
+            await self.precompute_followup_questions(uid, job["summary_payload"]["summary"])
+            return "ok"
+
+        path, turn_count = job["transcript_path"], job.get("turn_count")
+        try:
+            chunks = await asyncio.to_thread(load_chunks, path, turn_count)
+            tail_start = chunks[-1]["end"] if chunks else 0
+            transcript = await asyncio.to_thread(read_transcript, path, turn_count, tail_start)
+        except FileNotFoundError:
+            logger.error(f"Transcript {path} is gone; dropping summary job.")
+            return None
+        if not transcript and not chunks:
             logger.info("No transcript found; skipping summary.")
             return None
+        if chunks:
+            logger.info(f"Merging {len(chunks)} chunk summaries with {len(transcript)} remaining turns")
+
+        user_name = next((c["user_name"] for c in chunks if c.get("user_name")), None) or find_user_name(transcript)
 
-        # This part for extracting user name remains the same
-        user_name = None
-        for message in transcript:
-            if message.get("role") == "user":
-                text = message.get("text", "").lower()
-                if "my name is" in text:
-                    user_name = text.split("my name is")[-1].strip().title()
-                    break
-        
         if user_name:
             try:
-                requests.post("http://localhost:3000/save-name", json={"uid": uid, "name": user_name})
-            except requests.exceptions.RequestException as e:
+                await self.db.save_name(uid, user_name)
+            except DBClientError as e:
                 logger.error(f"Error saving user name: {e}")
 
         # This part for fetching previous summary remains the same
         previous_summary = ""
         try:
-            response = requests.get(f"http://localhost:3000/get-summary/{uid}")
-            if response.status_code == 200:
-                previous_summary = response.json().get("latestSummary", {}).get("summary_data", {}).get("summary", "")
-        except requests.exceptions.RequestException as e:
+            summary_data = await self.db.get_summary(uid)
+            if summary_data:
+                previous_summary = summary_data.get("latestSummary", {}).get("summary_data", {}).get("summary", "")
+        except DBClientError as e:
             logger.error(f"Error fetching previous summary: {e}")
 
-        flat_transcript = "\n".join(
-            f"{turn.get('role', 'user').upper()}: {turn.get('text', '').strip()}"
-            for turn in transcript if turn.get("text", "").strip()
-        )
+        flat_transcript = flatten_turns(transcript)
+        if chunks:
+            earlier_notes = "\n\n".join(c["summary"] for c in chunks)
+            flat_transcript = (
+                f"EARLIER IN THIS SESSION (condensed notes, in order):\n{earlier_notes}\n\n"
+                f"REST OF THE SESSION:\n{flat_transcript}"
+            )
 
-        session_handle = self.session_ids.get(client_id)
+        session_handle = job.get("session_id")
 
         # --- UPDATED SCHEMA: More Medical Background ---
         # This schema focuses on capturing objective, user-reported clinical information.
@@ -489,6 +861,11 @@ class LiveAPIWebSocketServer:
         if summarizer_model != MODEL:
             logger.info(f"Using summarizer model '{summarizer_model}' for generateContent (from '{MODEL}')")
 
+        system_note = (
+            "You extract structured information from health conversations. "
+            "Respond with a single JSON object and nothing else."
+        )
+
         # Build Content/Part properly
         user_content = types.Content(
             role="user",
@@ -496,7 +873,7 @@ class LiveAPIWebSocketServer:
         )
 
         # Call the text model
-        gen = await client.aio.models.generate_content(
+        gen = await get_client().aio.models.generate_content(
             model=summarizer_model,
             contents=[user_content],  # could also pass contents=user_prompt (string)
             config=types.GenerateContentConfig(
@@ -523,22 +900,27 @@ class LiveAPIWebSocketServer:
         logger.info(f"Parsed and validated summary object: {json.dumps(summary_obj, indent=2)}")
 
         # Send to Node.js backend
-        try:
-            payload = {
-                "uid": uid,
-                "summary": {
-                    "summary_data": summary_obj,
-                    "meta": {
-                        "client_id": client_id,
-                        "session_id": session_handle,
-                        "saved_at_utc": datetime.now(timezone.utc).isoformat(),
-                    }
+        payload = {
+            "uid": uid,
+            "summary": {
+                "summary_data": summary_obj,
+                "meta": {
+                    "client_id": client_id,
+                    "session_id": session_handle,
+                    "saved_at_utc": datetime.now(timezone.utc).isoformat(),
                 }
             }
-            response = requests.post("http://localhost:3000/save-summary", json=payload)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            logger.info(f"✅ Summary sent to Node.js backend: {response.text}")
-            return "ok"
-        except requests.exceptions.RequestException as e:
+        }
+        # Checkpoint the generated summary so a retry only repeats the save
+        job["summary_payload"] = payload
+        await self.summary_queue.save(job)
+        try:
+            body = await self.db.save_summary(payload)
+            logger.info(f"✅ Summary sent to Node.js backend: {body}")
+        except DBClientError as e:
             logger.error(f"Error sending summary to Node.js backend: {e}")
-            return None
+            raise
+
+        # Prepare the next session's opening questions now, off the connect path
+        await self.precompute_followup_questions(uid, payload["summary"])
+        return "ok"
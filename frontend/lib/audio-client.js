@@ -149,12 +149,15 @@ class AudioClient {
 
               // Send user ID after receiving ready if we have it and haven't sent it
               if (this.userId && !this.userIdSent) {
-                this.ws.send(
-                  JSON.stringify({
-                    type: "user_id",
-                    data: this.userId,
-                  })
-                )
+                const userIdMessage = {
+                  type: "user_id",
+                  data: this.userId,
+                }
+                // On a reconnect, hand back the last session handle so the server can resume the conversation
+                if (this.sessionId) {
+                  userIdMessage.session_handle = this.sessionId
+                }
+                this.ws.send(JSON.stringify(userIdMessage))
                 this.userIdSent = true
               }
 